@@ -1,19 +1,61 @@
 from typing import Optional, Dict, Any, Literal, Annotated, AsyncIterator
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, END, START, MessagesState
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.types import interrupt, Command
+from langgraph.config import get_config, get_stream_writer
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage, RemoveMessage
 from langchain_core.messages.utils import trim_messages
 from pydantic import BaseModel, Field
-from ai.models import get_model
+from ai.models import get_model, generate_text, stream_text
 from ai.tools import get_courses_tool, enroll_student_tool, search_courses_tool
+from ai.catalog import course_catalog
+from ai.enrollment_matcher import EnrollmentMatcher
+from ai.course_index import CourseIndex, COURSE_FILTER_LIMIT
+from ai.guard import get_guard
+from ai.cache import response_cache, normalize_message, TTLCache
+from ai.singleflight import SingleFlight
+from ai.batching import MicroBatcher
+from ai.resilience import llm_latency, call_with_breaker, RequestBudgetExceeded
+from ai.checkpointer import create_checkpointer
+from ai.intent_classifier import load_intent_classifier
+from ai import metrics
+import os
 import json
+import hashlib
+import time
 import re
 import asyncio
+import uuid
 from datetime import datetime
 
 
+# Returned instead of any response that mentions an external platform
+CATALOG_ONLY_RESPONSE = """I can only recommend courses from our catalog. Here are our AI courses for beginners:
+
+1. **Introduction to Artificial Intelligence** (Beginner, 40h) - Perfect for beginners, covers fundamentals of AI, machine learning, and neural networks.
+
+2. **Advanced Machine Learning with Python** (Advanced, 60h) - Deep dive into ML algorithms and real-world applications.
+
+3. **Deep Learning and Neural Networks** (Advanced, 70h) - Build and train deep learning models using TensorFlow and PyTorch.
+
+Would you like to enroll in any of these courses?"""
+
+# Returned by a response node whose LLM call ran past the request deadline
+DEADLINE_RESPONSE = "Sorry, this is taking longer than expected. Please try again in a moment."
+
+# Conversation ids sent back by clients (issued by new_conversation_id)
+CONVERSATION_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
+
+# Keyword rules for the local router, in priority order: (intent, keywords, reasoning)
+ROUTER_KEYWORDS = [
+    ("enrollment", ["enroll", "sign up", "register", "join", "take this", "take the"], "User wants to enroll in a course"),
+    ("recommendation", ["recommend", "suggest", "what should i", "which course", "best for"], "User wants course recommendations"),
+    ("complex_query", ["compare", "analyze", "detailed"], "Complex query requiring decomposition"),
+    ("course_discovery", ["show", "list", "browse", "search", "find", "courses about", "courses on"], "User wants to discover/search courses"),
+]
+
+
 # Structured output schemas for LLM-based routing
 class RouteDecision(BaseModel):
     """LLM-based decision on which node to route to"""
@@ -34,6 +76,16 @@ class RouteDecision(BaseModel):
     )
 
 
+class BatchedRouteDecision(RouteDecision):
+    """Routing decision for one message of a batch"""
+    index: int = Field(description="Number of the message this decision is for")
+
+
+class RouteDecisionBatch(BaseModel):
+    """LLM-based routing decisions for several messages at once"""
+    decisions: list[BatchedRouteDecision]
+
+
 class CourseQuery(BaseModel):
     """Structured course search query"""
     category: Optional[str] = Field(None, description="Course category (AI, DevOps, Docker, Kubernetes)")
@@ -76,8 +128,8 @@ class AgentState(TypedDict):
     requires_approval: bool  # Whether action needs approval
     
     # Processing
-    courses: list[Dict[str, Any]]  # Available courses
-    filtered_courses: list[Dict[str, Any]]  # Filtered/relevant courses
+    catalog_version: int  # Catalog version pinned by load_courses; keys the response cache for this turn
+    filtered_course_ids: list[int]  # Relevant course ids (resolved against course_catalog)
     query: Optional[CourseQuery]  # Structured search query
     
     # Enrollment
@@ -85,6 +137,12 @@ class AgentState(TypedDict):
     
     # Response (with quality evaluation)
     response: str  # Final response to user
+    response_cache_key: Optional[tuple]  # Set when the response may be cached once finalized
+    response_cache_hit: bool  # Response was served from the response cache
+    
+    # Latency budget
+    deadline: Optional[float]  # Unix time by which the response is due (None = no budget)
+    skipped_stages: list[str]  # Stages skipped or cut short because the budget ran low
     draft_response: Optional[str]  # Draft response before evaluation
     quality_score: Optional[float]  # Quality evaluation score
     refinement_count: int  # Number of refinements made
@@ -113,29 +171,54 @@ class LMSAgent:
             "enroll_student": enroll_student_tool
         }
         self.graph = None
-        self.checkpointer = MemorySaver()  # In-memory checkpointing
+        self.checkpointer = create_checkpointer()  # Postgres-backed unless CHECKPOINT_BACKEND=memory
+        self._graphs: Dict[tuple, Any] = {}  # Compiled graphs cached per model
+        self.max_cached_graphs = 32  # Model names come from requests, so bound the cache
         self.max_refinements = 2  # Maximum refinement iterations
         self.max_messages = 20  # Maximum messages to keep in history (Phase 4A)
         self.max_tokens = 4000  # Maximum tokens for context (Phase 4A)
+        # Minimum local classifier confidence to skip the LLM routing call
+        self.router_confidence_threshold = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.8"))
+        self.intent_classifier = load_intent_classifier()  # None until a model is trained
+        self._route_log_tasks: set = set()  # Routing label inserts running in the background
+        # LLM routing decisions by (normalized message, model), reused within the TTL
+        self.route_cache = TTLCache(
+            "route_cache",
+            int(os.getenv("ROUTE_CACHE_SIZE", "2048")),
+            float(os.getenv("ROUTE_CACHE_TTL_SECONDS", "600"))
+        )
+        self._llm_calls = SingleFlight("llm")  # Identical concurrent prompts share one provider call
+        # Optional micro-batching of LLM routing calls across concurrent requests
+        self.router_batch_enabled = os.getenv("ROUTER_BATCH_ENABLED", "false").lower() == "true"
+        self.router_batch_window_ms = float(os.getenv("ROUTER_BATCH_WINDOW_MS", "10"))
+        self.router_batch_max_size = int(os.getenv("ROUTER_BATCH_MAX_SIZE", "16"))
+        self.router_batch_timeout = float(os.getenv("ROUTER_BATCH_TIMEOUT_SECONDS", "10"))
+        self._router_batchers: Dict[str, MicroBatcher] = {}
+        # Backup model for hedged requests and failover (e.g. a different provider)
+        self.backup_model = os.getenv("LLM_BACKUP_MODEL") or None
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        # Per-request latency budget; optional stages are skipped below the minimum remaining budget
+        self.latency_budget = float(os.getenv("CHAT_LATENCY_BUDGET_SECONDS", "30"))
+        self.optional_stage_min_budget = float(os.getenv("OPTIONAL_STAGE_MIN_BUDGET_SECONDS", "5"))
     
     def _build_graph(self, model_name: str, enable_checkpointing: bool = True) -> StateGraph:
         """Build the LangGraph workflow with Phase 3 features"""
         
         # Create wrapper functions that properly handle async
         async def course_discovery_wrapper(state):
-            return await self._course_discovery_node(state, model_name)
+            return await self._within_deadline("course_discovery", state, self._course_discovery_node(state, model_name))
         
         async def enrollment_wrapper(state):
             return await self._enrollment_node(state, model_name)
         
         async def recommendation_wrapper(state):
-            return await self._recommendation_node(state, model_name)
+            return await self._within_deadline("recommendation", state, self._recommendation_node(state, model_name))
         
         async def general_qa_wrapper(state):
-            return await self._general_qa_node(state, model_name)
+            return await self._within_deadline("general_qa", state, self._general_qa_node(state, model_name))
         
         async def llm_router_wrapper(state):
-            return await self._llm_based_router_node(state, model_name)
+            return await self._tiered_router_node(state, model_name)
         
         async def evaluator_wrapper(state):
             return await self._evaluator_node(state, model_name)
@@ -147,14 +230,14 @@ class LMSAgent:
             return await self._orchestrator_node(state, model_name)
         
         async def worker_wrapper(state):
-            return await self._worker_node(state, model_name)
+            return await self._within_deadline("worker", state, self._worker_node(state, model_name))
         
         # Create the graph
         workflow = StateGraph(AgentState)
         
         # Add Phase 1 & 2 nodes
         workflow.add_node("load_courses", self._load_courses_node)
-        workflow.add_node("llm_router", llm_router_wrapper)  # LLM-based routing
+        workflow.add_node("llm_router", llm_router_wrapper)  # Local classifier, LLM fallback
         workflow.add_node("course_discovery", course_discovery_wrapper)
         workflow.add_node("enrollment", enrollment_wrapper)
         workflow.add_node("recommendation", recommendation_wrapper)
@@ -234,21 +317,82 @@ class LMSAgent:
         else:
             return workflow.compile()
     
+    def get_graph(self, model_name: str, enable_checkpointing: bool = True):
+        """Get the compiled workflow for a model, compiling it only on first use"""
+        key = (model_name, enable_checkpointing)
+        graph = self._graphs.get(key)
+        if graph is None:
+            graph = self._build_graph(model_name, enable_checkpointing)
+            if len(self._graphs) < self.max_cached_graphs:
+                self._graphs[key] = graph
+        return graph
+    
+    @staticmethod
+    def new_conversation_id() -> str:
+        """Id for a new conversation; each conversation gets its own checkpoint thread"""
+        return uuid.uuid4().hex
+    
+    @staticmethod
+    def thread_id(conversation_id: str, student_id: Optional[int] = None) -> str:
+        """Checkpoint thread for a conversation, scoped to the student so ids can't reach another account"""
+        owner = f"student_{student_id}" if student_id else "anonymous"
+        return f"{owner}:{conversation_id}"
+    
+    def new_deadline(self) -> Optional[float]:
+        """Deadline for a request starting now (None when no budget is configured)"""
+        return time.time() + self.latency_budget if self.latency_budget > 0 else None
+    
+    def _remaining_budget(self, state: Optional[Dict[str, Any]] = None) -> Optional[float]:
+        """Seconds left before the request deadline
+        
+        The run config wins over the state, whose deadline may be stale when a
+        checkpointed thread is resumed.
+        """
+        try:
+            deadline = get_config().get("configurable", {}).get("deadline")
+        except RuntimeError:
+            # Not running inside a graph
+            deadline = None
+        if deadline is None:
+            deadline = (state or {}).get("deadline")
+        return None if deadline is None else deadline - time.time()
+    
+    def _budget_low(self, state: Dict[str, Any]) -> bool:
+        """Whether optional stages should be skipped"""
+        remaining = self._remaining_budget(state)
+        return remaining is not None and remaining < self.optional_stage_min_budget
+    
+    def _skip_stage(self, state: Dict[str, Any], stage: str) -> list[str]:
+        """skipped_stages with stage added"""
+        metrics.increment(f"deadline.skipped.{stage}")
+        return [*state.get("skipped_stages", []), stage]
+    
+    async def _within_deadline(self, stage: str, state: Dict[str, Any], node) -> Dict[str, Any]:
+        """Run a response node, answering with DEADLINE_RESPONSE if its LLM call runs out of time"""
+        try:
+            return await node
+        except RequestBudgetExceeded:
+            return {"response": DEADLINE_RESPONSE, "skipped_stages": self._skip_stage(state, stage)}
+    
     async def process_message(
         self,
         message: str,
         model: str = "gemini-2.5-flash-lite",
-        student_id: Optional[int] = None
+        student_id: Optional[int] = None,
+        conversation_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Process user message using LangGraph workflow"""
+        """Process user message using LangGraph workflow (a new conversation unless conversation_id is given)"""
+        
+        deadline = self.new_deadline()
+        conversation_id = conversation_id or self.new_conversation_id()
         
         try:
             # Get message history (Phase 4A)
             messages = await self._get_message_history(student_id)
             messages.append(HumanMessage(content=message))
             
-            # Build graph for this request
-            graph = self._build_graph(model)
+            # Reuse the compiled graph for this model
+            graph = self.get_graph(model)
             
             # Initial state with Phase 4 fields
             initial_state = {
@@ -259,8 +403,8 @@ class LMSAgent:
                 "route_reasoning": None,
                 "route_confidence": None,
                 "requires_approval": False,
-                "courses": [],
-                "filtered_courses": [],
+                "catalog_version": 0,
+                "filtered_course_ids": [],
                 "query": None,
                 "enrollment_results": [],
                 "response": "",
@@ -275,13 +419,18 @@ class LMSAgent:
                 "pending_approval": False,
                 "approval_message": None,
                 "approved": None,
-                "interrupt_data": None
+                "interrupt_data": None,
+                "response_cache_key": None,
+                "response_cache_hit": False,
+                "deadline": deadline,
+                "skipped_stages": []
             }
             
             # Run the graph with checkpointing config
             config = {
                 "configurable": {
-                    "thread_id": f"student_{student_id}" if student_id else "anonymous"
+                    "thread_id": self.thread_id(conversation_id, student_id),
+                    "deadline": deadline
                 }
             }
             final_state = await graph.ainvoke(initial_state, config=config)
@@ -292,7 +441,9 @@ class LMSAgent:
                 "suggestions": final_state["suggestions"],
                 "enrolled": final_state["enrolled"],
                 "pending_approval": final_state.get("pending_approval", False),
-                "approval_message": final_state.get("approval_message")
+                "approval_message": final_state.get("approval_message"),
+                "skipped_stages": final_state.get("skipped_stages", []),
+                "conversation_id": conversation_id
             }
         
         except Exception as e:
@@ -301,23 +452,29 @@ class LMSAgent:
                 "model_used": model,
                 "suggestions": [],
                 "enrolled": False,
-                "pending_approval": False
+                "pending_approval": False,
+                "conversation_id": conversation_id
             }
     
     async def process_message_stream(
         self,
         message: str,
         model: str = "gemini-2.5-flash-lite",
-        student_id: Optional[int] = None
+        student_id: Optional[int] = None,
+        conversation_id: Optional[str] = None
     ) -> AsyncIterator[Dict[str, Any]]:
-        """Process user message with streaming updates"""
+        """Process user message with streaming updates (a new conversation unless conversation_id is given)"""
+        
+        deadline = self.new_deadline()
+        conversation_id = conversation_id or self.new_conversation_id()
         
         try:
-            # Yield initial status
+            # Yield initial status (with the conversation id to send back next time)
             yield {
                 "type": "status",
                 "status": "starting",
-                "message": "Initializing agent..."
+                "message": "Initializing agent...",
+                "conversation_id": conversation_id
             }
             
             # Get conversation context
@@ -330,13 +487,13 @@ class LMSAgent:
                 }
                 conversation_history = await self._get_recent_context(student_id)
             
-            # Build graph
+            # Get compiled graph
             yield {
                 "type": "status",
                 "status": "building_graph",
                 "message": "Building workflow..."
             }
-            graph = self._build_graph(model)
+            graph = self.get_graph(model)
             
             # Initial state
             initial_state = {
@@ -345,25 +502,42 @@ class LMSAgent:
                 "conversation_history": conversation_history,
                 "route": None,
                 "route_reasoning": None,
-                "courses": [],
-                "filtered_courses": [],
+                "catalog_version": 0,
+                "filtered_course_ids": [],
                 "query": None,
                 "enrollment_results": [],
                 "response": "",
                 "suggestions": [],
                 "model_used": model,
-                "enrolled": False
+                "enrolled": False,
+                "response_cache_key": None,
+                "response_cache_hit": False,
+                "deadline": deadline,
+                "skipped_stages": []
             }
             
-            # Checkpointing config
+            # Checkpointing config (with token streaming from response nodes)
             config = {
                 "configurable": {
-                    "thread_id": f"student_{student_id}" if student_id else "anonymous"
+                    "thread_id": self.thread_id(conversation_id, student_id),
+                    "stream_tokens": True,
+                    "deadline": deadline
                 }
             }
             
-            # Stream graph execution
-            async for event in graph.astream(initial_state, config=config, stream_mode="updates"):
+            # Stream graph execution once; "values" tracks the full state so the
+            # final result doesn't need a second run of the graph
+            final_state = initial_state
+            async for mode, event in graph.astream(initial_state, config=config, stream_mode=["updates", "values", "custom"]):
+                if mode == "values":
+                    final_state = event
+                    continue
+                
+                if mode == "custom":
+                    # Token chunks forwarded while a node is still generating
+                    yield event
+                    continue
+                
                 # Extract node name and state update
                 for node_name, state_update in event.items():
                     yield {
@@ -373,9 +547,6 @@ class LMSAgent:
                         "data": state_update
                     }
             
-            # Get final state
-            final_state = await graph.ainvoke(initial_state, config=config)
-            
             # Yield final result
             yield {
                 "type": "complete",
@@ -385,7 +556,9 @@ class LMSAgent:
                     "response": final_state["response"],
                     "model_used": final_state["model_used"],
                     "suggestions": final_state["suggestions"],
-                    "enrolled": final_state["enrolled"]
+                    "enrolled": final_state["enrolled"],
+                    "skipped_stages": final_state.get("skipped_stages", []),
+                    "conversation_id": conversation_id
                 }
             }
         
@@ -399,7 +572,7 @@ class LMSAgent:
     def get_graph_visualization(self, model: str = "gemini-2.5-flash-lite") -> Dict[str, Any]:
         """Get graph structure for visualization"""
         try:
-            graph = self._build_graph(model)
+            graph = self.get_graph(model)
             graph_data = graph.get_graph()
             
             # Extract nodes and edges
@@ -433,47 +606,111 @@ class LMSAgent:
     # ===== GRAPH NODES =====
     
     async def _load_courses_node(self, state: AgentState) -> Dict[str, Any]:
-        """Node: Load all available courses (with parallelization)"""
-        student_id = state.get("student_id")
+        """Node: Make sure the course catalog is loaded and pin its version for this turn
         
-        # PARALLELIZATION: Fetch courses
-        courses = await get_courses_tool()
+        Courses stay in the shared catalog; state only carries the version and course ids,
+        so checkpoints and streamed state don't grow with the catalog.
+        """
+        await course_catalog.get_courses()
         
         # Phase 4A: Trim messages to prevent context overflow
         messages = state.get("messages", [])
         trimmed_messages = await self._trim_messages(messages)
         
         return {
-            "courses": courses,
+            "catalog_version": course_catalog.version,
             "messages": trimmed_messages
         }
     
     async def _router_node(self, state: AgentState) -> Dict[str, Any]:
-        """Node: Route to appropriate handler based on intent"""
+        """Node: Route to appropriate handler based on intent (local keyword classifier)"""
         
         message = state["message"].lower()
         
-        # Simple rule-based routing with confidence
-        if any(word in message for word in ["enroll", "sign up", "register", "join", "take this", "take the"]):
-            return {
-                "route": "enrollment",
-                "route_reasoning": "User wants to enroll in a course"
-            }
-        elif any(word in message for word in ["recommend", "suggest", "what should i", "which course", "best for"]):
-            return {
-                "route": "recommendation",
-                "route_reasoning": "User wants course recommendations"
-            }
-        elif any(word in message for word in ["show", "list", "browse", "search", "find", "courses about", "courses on"]):
-            return {
-                "route": "course_discovery",
-                "route_reasoning": "User wants to discover/search courses"
-            }
-        else:
+        # Every intent whose keywords appear, in priority order
+        matches = [
+            (intent, reasoning)
+            for intent, keywords, reasoning in ROUTER_KEYWORDS
+            if any(word in message for word in keywords)
+        ]
+        
+        if not matches:
             return {
                 "route": "general_qa",
-                "route_reasoning": "General question or conversation"
+                "route_reasoning": "General question or conversation",
+                "route_confidence": 0.5,
+                "requires_approval": False
             }
+        
+        # Simple rule-based routing with confidence: ambiguous when several intents match
+        route, reasoning = matches[0]
+        return {
+            "route": route,
+            "route_reasoning": reasoning,
+            "route_confidence": 0.9 if len(matches) == 1 else 0.6,
+            "requires_approval": route == "enrollment" and ("all" in message or "bulk" in message)
+        }
+    
+    async def _classifier_router_node(self, state: AgentState) -> Optional[Dict[str, Any]]:
+        """Node: Route with the trained intent classifier (None if no model is loaded)"""
+        
+        if not self.intent_classifier:
+            return None
+        
+        intent, confidence = self.intent_classifier.predict([state["message"]])[0]
+        message = state["message"].lower()
+        return {
+            "route": intent,
+            "route_reasoning": f"Intent classifier predicted {intent}",
+            "route_confidence": confidence,
+            "requires_approval": intent == "enrollment" and ("all" in message or "bulk" in message)
+        }
+    
+    async def _tiered_router_node(self, state: AgentState, model_name: str) -> Dict[str, Any]:
+        """Node: Route locally (keywords, then classifier), consulting the LLM only when unsure"""
+        
+        metrics.increment("router.total")
+        
+        decision = await self._router_node(state)
+        if decision["route_confidence"] < self.router_confidence_threshold:
+            decision = await self._classifier_router_node(state) or decision
+        
+        if decision["route_confidence"] >= self.router_confidence_threshold:
+            # Fast path: no LLM round trip for routing
+            metrics.increment("router.fast_path")
+            return decision
+        
+        if self._budget_low(state):
+            # Not enough time left for a routing round trip: keep the local decision
+            return {**decision, "skipped_stages": self._skip_stage(state, "llm_router")}
+        
+        metrics.increment("router.llm")
+        return await self._llm_based_router_node(state, model_name)
+    
+    def _log_route_decision(self, message: str, decision: Dict[str, Any], source: str, model_name: str):
+        """Record a routing decision as a training label for the intent classifier (off the request path)"""
+        task = asyncio.ensure_future(self._insert_route_decision(message, decision, source, model_name))
+        self._route_log_tasks.add(task)
+        task.add_done_callback(self._route_log_tasks.discard)
+    
+    async def _insert_route_decision(self, message: str, decision: Dict[str, Any], source: str, model_name: str):
+        from models import RouteDecisionLog
+        
+        try:
+            await RouteDecisionLog.create(
+                message=message,
+                intent=decision["route"],
+                confidence=decision.get("route_confidence") or 0.0,
+                source=source,
+                model_used=model_name
+            )
+        except Exception as e:
+            print(f"Could not log route decision: {e}")
+    
+    async def aflush_route_log(self) -> None:
+        """Wait for pending routing label inserts (call before shutdown)"""
+        if self._route_log_tasks:
+            await asyncio.gather(*self._route_log_tasks, return_exceptions=True)
     
     def _route_decision(self, state: AgentState) -> str:
         """Conditional edge function to route to next node"""
@@ -483,17 +720,17 @@ class LMSAgent:
         """Node: Handle course discovery and search"""
         
         llm = get_model(model_name)
-        courses = state["courses"]
         message = state["message"]
         
-        # Filter courses based on message
-        filtered = self._filter_courses(message, courses)
+        # Filter courses based on message (inverted index shared per catalog version)
+        filtered = await self._filter_courses(message)
         
-        # Format courses for response
-        courses_list = "\n".join([
-            f"- **{course['title']}** ({course['difficulty']}, {course['duration_hours']}h)\n  {course['description']}"
-            for course in filtered
-        ])
+        cache_key, cached = self._cached_response(state, "course_discovery", model_name)
+        if cached:
+            return {"filtered_course_ids": filtered, **cached}
+        
+        # Format courses for response (prompt lines are cached per catalog version)
+        courses_list = await course_catalog.render("discovery", filtered)
         
         prompt = f"""You are helping a student discover courses from our internal catalog.
 
@@ -513,11 +750,12 @@ YOUR TASK:
 
 Respond now using ONLY courses from our catalog above."""
         
-        response_text = await self._get_llm_response(llm, prompt, model_name)
+        response_text = await self._get_llm_response(llm, prompt, model_name, stream_tokens=True)
         
         return {
-            "filtered_courses": filtered,
-            "response": response_text
+            "filtered_course_ids": filtered,
+            "response": response_text,
+            "response_cache_key": cache_key
         }
     
     async def _enrollment_node(self, state: AgentState, model_name: str) -> Dict[str, Any]:
@@ -525,14 +763,13 @@ Respond now using ONLY courses from our catalog above."""
         
         message = state["message"]
         student_id = state["student_id"]
-        courses = state["courses"]
         messages = state.get("messages", [])
         
         enrollment_results = []
         
         if student_id:
             enrollment_results = await self._check_enrollment_intent(
-                message, student_id, courses, messages
+                message, student_id, messages
             )
         
         # Build response
@@ -567,14 +804,14 @@ Respond now using ONLY courses from our catalog above."""
         """Node: Provide personalized course recommendations"""
         
         llm = get_model(model_name)
-        courses = state["courses"]
         message = state["message"]
         messages = state.get("messages", [])
         
-        courses_list = "\n".join([
-            f"- {course['title']} ({course['difficulty']}, {course['duration_hours']}h, {course['category']})"
-            for course in courses
-        ])
+        cache_key, cached = self._cached_response(state, "recommendation", model_name)
+        if cached:
+            return cached
+        
+        courses_list = await course_catalog.render("recommendation")
         
         prompt = f"""You are a course advisor for our internal Learning Management System.
 
@@ -602,22 +839,22 @@ Would you like to enroll in any of these?"
 
 Respond now using ONLY courses from our catalog above."""
         
-        response_text = await self._get_llm_response(llm, prompt, model_name)
+        response_text = await self._get_llm_response(llm, prompt, model_name, stream_tokens=True)
         
-        return {"response": response_text}
+        return {"response": response_text, "response_cache_key": cache_key}
     
     async def _general_qa_node(self, state: AgentState, model_name: str) -> Dict[str, Any]:
         """Node: Handle general questions and conversation"""
         
         llm = get_model(model_name)
-        courses = state["courses"]
         message = state["message"]
         messages = state.get("messages", [])
         
-        courses_list = "\n".join([
-            f"- {course['title']} ({course['category']}, {course['difficulty']})"
-            for course in courses
-        ])
+        cache_key, cached = self._cached_response(state, "general_qa", model_name)
+        if cached:
+            return cached
+        
+        courses_list = await course_catalog.render("general_qa")
         
         prompt = f"""You are a friendly AI assistant for our internal Learning Management System.
 
@@ -637,13 +874,19 @@ YOUR TASK:
 
 Respond now using ONLY courses from our catalog."""
         
-        response_text = await self._get_llm_response(llm, prompt, model_name)
+        response_text = await self._get_llm_response(llm, prompt, model_name, stream_tokens=True)
         
-        return {"response": response_text}
+        return {"response": response_text, "response_cache_key": cache_key}
     
     async def _generate_suggestions_node(self, state: AgentState) -> Dict[str, Any]:
         """Node: Generate follow-up suggestions"""
         
+        # The response is final here; only cache it if it went through every stage, since
+        # cache hits skip evaluation and refinement
+        if (state.get("response_cache_key") and not state.get("response_cache_hit")
+                and not state.get("skipped_stages")):
+            response_cache.put(tuple(state["response_cache_key"]), state.get("response", ""))
+        
         message = state["message"].lower()
         enrollment_results = state["enrollment_results"]
         route = state["route"]
@@ -696,29 +939,36 @@ Respond now using ONLY courses from our catalog."""
     
     # ===== HELPER METHODS =====
     
-    def _filter_courses(self, message: str, courses: list) -> list:
-        """Filter courses based on message content"""
-        message_lower = message.lower()
-        filtered = []
+    async def _filter_courses(self, message: str) -> list[int]:
+        """Ids of courses matching the message, strongest matches first"""
+        index = await course_catalog.derived("course_index", CourseIndex)
+        filtered = index.search(message)
         
-        for course in courses:
-            # Check category match
-            if course["category"].lower() in message_lower:
-                filtered.append(course)
-                continue
-            
-            # Check difficulty match
-            if course["difficulty"].lower() in message_lower:
-                filtered.append(course)
-                continue
-            
-            # Check title keywords
-            title_words = course["title"].lower().split()
-            if any(word in message_lower for word in title_words if len(word) > 3):
-                filtered.append(course)
-        
-        # If no matches, return all courses
-        return filtered if filtered else courses
+        # If no matches, return the catalog (capped like any other result)
+        return [course["id"] for course in (filtered or index.courses[:COURSE_FILTER_LIMIT])]
+    
+    def _cached_response(self, state: AgentState, route: str, model_name: str):
+        """Response cache lookup for a response node, keyed on the turn's pinned catalog version
+        
+        Returns (cache_key, state update); the update is None on a miss. If the catalog
+        changed since load_courses pinned it, the answer is built from a different catalog
+        than this turn started with, so it is neither looked up nor cached.
+        """
+        if state.get("catalog_version") != course_catalog.version:
+            metrics.increment("response_cache.catalog_changed")
+            return None, None
+        
+        cache_key = response_cache.key(state["message"], route, model_name, state["catalog_version"])
+        cached = response_cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+        
+        # Streamed clients get the cached answer as a single token chunk
+        token_writer = self._get_token_writer()
+        if token_writer:
+            token_writer({"type": "token", "content": cached})
+        
+        return None, {"response": cached, "response_cache_hit": True, "response_cache_key": None}
     
     async def _get_message_history(self, student_id: Optional[int]) -> list[BaseMessage]:
         """Phase 4A: Get message history as BaseMessage objects"""
@@ -767,7 +1017,7 @@ Respond now using ONLY courses from our catalog."""
             # Fallback: just return last N messages
             return messages[-self.max_messages:]
     
-    async def _check_enrollment_intent(self, message: str, student_id: int, courses: list, messages: list[BaseMessage] = None) -> list:
+    async def _check_enrollment_intent(self, message: str, student_id: int, messages: list[BaseMessage] = None) -> list:
         """Check if user wants to enroll and process enrollment(s)"""
         message_lower = message.lower()
         
@@ -782,121 +1032,27 @@ Respond now using ONLY courses from our catalog."""
             return []
         
         enrollment_results = []
-        courses_to_enroll = []
         
         # Combine message and recent context for better course detection
         context = " ".join([m.content for m in (messages or [])[-3:]]) if messages else ""
-        search_text = message_lower + " " + context.lower()
         
-        # Search for specific course mentions in the message
-        for course in courses:
-            course_title_lower = course["title"].lower()
-            course_category = course["category"].lower()
-            course_difficulty = course["difficulty"].lower()
-            
-            # Check if full course title is mentioned (most specific match)
-            if course_title_lower in message_lower:
-                courses_to_enroll.append(course)
-                continue
-            
-            # Extract meaningful words from course title (excluding common words)
-            title_words = [w for w in course_title_lower.split() if w not in ['to', 'the', 'and', 'with', 'for', 'from', 'a', 'an', 'in', 'of', 'on']]
-            
-            # Handle abbreviations ONLY if they appear as standalone words
-            # This prevents "basics" from matching "ai" in "basics"
-            abbreviations = {
-                "ai": ["artificial", "intelligence"],
-                "ml": ["machine", "learning"],
-                "k8s": ["kubernetes"],
-                "devops": ["devops"]
-            }
-            
-            # Check for abbreviation matches (must be standalone word)
-            message_words = message_lower.split()
-            for abbr, full_words in abbreviations.items():
-                # Only match if abbreviation is a standalone word AND no other specific words
-                if abbr in message_words:
-                    # Check if the course contains these full words
-                    if all(word in course_title_lower for word in full_words):
-                        # Additional check: make sure user isn't asking for a different specific course
-                        # If they mention other specific words like "ethics", "basics", don't match generic AI
-                        specific_words = ["ethics", "basics", "introduction", "advanced", "deep", "neural"]
-                        has_specific = any(word in message_lower for word in specific_words)
-                        
-                        # Only match if no specific words, OR if the specific words are in this course title
-                        if not has_specific or any(word in course_title_lower for word in specific_words if word in message_lower):
-                            courses_to_enroll.append(course)
-                            break
-            
-            # If already matched via abbreviation, continue
-            if course in courses_to_enroll:
-                continue
-            
-            # Check if significant keywords from course title are in message
-            # Require at least 2-3 CONSECUTIVE or UNIQUE key words to match
-            if len(title_words) >= 2:
-                # Count unique matches (not just any 2 words)
-                matched_words = [word for word in title_words if word in message_lower]
-                
-                # Need at least 2 unique words for short titles, 3 for longer titles
-                min_matches = 3 if len(title_words) >= 4 else 2
-                
-                if len(matched_words) >= min_matches:
-                    # Additional check: make sure these words appear close together in the message
-                    # This prevents "advanced" from one course matching "advanced" in another
-                    message_words = message_lower.split()
-                    
-                    # Find positions of matched words in the message
-                    positions = []
-                    for word in matched_words[:min_matches]:
-                        if word in message_words:
-                            positions.append(message_words.index(word))
-                    
-                    # If words are within 5 positions of each other, it's likely the same course
-                    if len(positions) >= min_matches:
-                        # Check if words are reasonably close (within 5 words)
-                        max_distance = max(positions) - min(positions)
-                        if max_distance <= 5:
-                            courses_to_enroll.append(course)
-                            continue
-            
-            # Check for single keyword match with category (e.g., "introduction ai")
-            if len(title_words) >= 1:
-                first_word = title_words[0]
-                if first_word in message_lower and course_category in message_lower:
-                    courses_to_enroll.append(course)
-                    continue
-            
-            # Check for category + difficulty combination (e.g., "kubernetes intermediate")
-            # Only if no other matches found yet
-            if not courses_to_enroll:
-                if course_category in message_lower and course_difficulty in message_lower:
-                    courses_to_enroll.append(course)
-                    continue
+        # Search for specific course mentions in the message (index built once per catalog version)
+        matcher = await course_catalog.derived("enrollment_matcher", EnrollmentMatcher)
+        courses_to_enroll = matcher.match(message_lower)
         
         # If no specific courses found but enrollment intent detected
         # Check for contextual references
         if not courses_to_enroll and context:
-            context_lower = context.lower()
+            mentioned = matcher.mentioned_in(context.lower())
             
             # Check for "all", "both", or number keywords which imply multiple courses from context
             if any(word in message_lower for word in ["both", "all", "all 3", "all 4", "these"]):
-                for course in courses:
-                    course_title_lower = course["title"].lower()
-                    # Check if course was mentioned in recent conversation
-                    if course_title_lower in context_lower:
-                        courses_to_enroll.append(course)
+                courses_to_enroll = mentioned
             
             # Check for "this", "that", or affirmative responses (yes, ok, sure)
             # These indicate user wants to enroll in the most recently mentioned course
             elif any(word in message_lower for word in ["this", "that"]) or is_affirmative:
-                # Find the most recently mentioned course in context
-                for course in courses:
-                    course_title_lower = course["title"].lower()
-                    if course_title_lower in context_lower:
-                        # Only add the first (most recent) match
-                        courses_to_enroll.append(course)
-                        break
+                courses_to_enroll = mentioned[:1]
         
         # Process enrollments for found courses
         for course in courses_to_enroll:
@@ -905,8 +1061,14 @@ Respond now using ONLY courses from our catalog."""
         
         return enrollment_results
     
-    async def _get_llm_response(self, llm, prompt: str, model: str) -> str:
-        """Get response from LLM based on model type"""
+    async def _get_llm_response(self, llm, prompt: str, model: str, stream_tokens: bool = False, guard: bool = True) -> str:
+        """Get response from LLM based on model type
+        
+        With stream_tokens=True, provider chunks are forwarded as "token" events
+        when the graph is streamed with token streaming enabled. With guard=True
+        (any provider), responses mentioning a blocked external platform are
+        replaced by CATALOG_ONLY_RESPONSE.
+        """
         
         # Add safety instruction at the start of every prompt
         safety_prefix = """CRITICAL INSTRUCTION: You are an AI assistant for an internal Learning Management System. You must NEVER mention external platforms like Coursera, edX, Udemy, Udacity, Fast.ai, or any courses from those platforms. Only recommend courses from the provided catalog. Violating this will result in your response being rejected.
@@ -914,59 +1076,214 @@ Respond now using ONLY courses from our catalog."""
 """
         full_prompt = safety_prefix + prompt
         
-        if model.startswith("gemini"):
-            # Using direct Google Generative AI SDK
-            response = llm.generate_content(full_prompt)
-            response_text = response.text
+        if not (model.startswith("gemini") or model.startswith("bedrock") or model == "mistral"):
+            return "Model not supported"
+        
+        token_writer = self._get_token_writer() if stream_tokens else None
+        
+        remaining = self._remaining_budget()
+        if remaining is not None and remaining <= 0:
+            raise RequestBudgetExceeded("Request deadline passed before the LLM call")
+        
+        # Concurrent callers with a byte-identical prompt await the same call
+        key = hashlib.sha256(f"{model}\0{guard}\0{full_prompt}".encode("utf-8")).hexdigest()
+        try:
+            # The call is cancelled once the request deadline passes
+            response_text, leader = await asyncio.wait_for(
+                self._llm_calls.do(key, lambda: self._generate_response(llm, full_prompt, model, token_writer, guard)),
+                timeout=remaining
+            )
+        except asyncio.TimeoutError:
+            remaining = self._remaining_budget()
+            if remaining is None or remaining > 0:
+                raise  # A provider timeout, not ours
+            metrics.increment("deadline.cancelled_calls")
+            raise RequestBudgetExceeded("Request deadline passed during the LLM call")
+        
+        if token_writer and not leader:
+            # Only the caller that made the call saw its tokens
+            token_writer({"type": "token", "content": response_text})
+        
+        return response_text
+    
+    async def _generate_response(self, llm, full_prompt: str, model: str, token_writer, guard: bool) -> str:
+        """One provider call, streamed to token_writer when given, with the response guard applied"""
+        backup = self._get_backup_model(model)
+        
+        if token_writer:
+            # No retries once tokens may have reached the client; failover covers it instead
+            try:
+                return await call_with_breaker(
+                    model, lambda: self._stream_llm_response(llm, full_prompt, model, token_writer, guard),
+                    retries=0, prompt=full_prompt
+                )
+            except Exception as e:
+                if backup is None:
+                    raise
+                # Fail over immediately, discarding any partial output already shown
+                print(f"⚠️ {model} failed ({e}), failing over to {backup}")
+                metrics.increment("llm.failovers")
+                token_writer({"type": "token_reset", "content": ""})
+                backup_llm = get_model(backup)
+                return await call_with_breaker(
+                    backup, lambda: self._stream_llm_response(backup_llm, full_prompt, backup, token_writer, guard),
+                    retries=0, prompt=full_prompt
+                )
+        
+        response_text = await self._hedged_generate(llm, full_prompt, model, backup)
+        
+        if guard and get_guard().contains(response_text):
+            # Response contains external courses, reject it completely
+            # Return a hardcoded response with actual courses
+            metrics.increment("guard.blocked")
+            return CATALOG_ONLY_RESPONSE
+        
+        return response_text
+    
+    def _get_backup_model(self, model: str) -> Optional[str]:
+        """Model used for hedging and failover, or None"""
+        if self.backup_model and self.backup_model != model:
+            return self.backup_model
+        return None
+    
+    async def _timed_generate(self, llm, full_prompt: str, model: str) -> str:
+        """Provider call (circuit breaker, retries) that records its latency for the model
+        
+        llm=None looks the client up here, so setup errors surface like call errors.
+        """
+        start = time.monotonic()
+        try:
+            llm = llm or get_model(model)
+            # Native async client where available, bounded thread pool otherwise
+            response_text = await call_with_breaker(model, lambda: generate_text(llm, model, full_prompt), prompt=full_prompt)
+        except Exception:
+            metrics.increment(f"llm.errors.{model}")
+            raise
+        llm_latency.record(model, time.monotonic() - start)
+        return response_text
+    
+    async def _hedged_generate(self, llm, full_prompt: str, model: str, backup: Optional[str]) -> str:
+        """Provider call hedged against the backup model
+        
+        If the primary call takes longer than the model's rolling p95, the same
+        prompt is also sent to the backup model and whichever answers first wins.
+        A failed call fails over to the backup immediately.
+        """
+        if backup is None:
+            return await self._timed_generate(llm, full_prompt, model)
+        
+        primary = asyncio.ensure_future(self._timed_generate(llm, full_prompt, model))
+        tasks = {primary}
+        try:
+            # None until enough latency samples exist: no hedging, only failover
+            hedge_after = llm_latency.percentile(model, self.hedge_percentile)
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
             
-            # Post-process to remove external course mentions
-            external_platforms = [
-                "coursera", "edx", "udemy", "udacity", "pluralsight", 
-                "linkedin learning", "fast.ai", "fast ai", "datacamp", 
-                "andrew ng", "ibm", "google", "microsoft", "amazon",
-                "khan academy", "skillshare", "treehouse"
-            ]
+            if primary in done:
+                if primary.exception() is None:
+                    return primary.result()
+                print(f"⚠️ {model} failed ({primary.exception()}), failing over to {backup}")
+                metrics.increment("llm.failovers")
+                return await self._timed_generate(None, full_prompt, backup)
             
-            # Check if response mentions external platforms
-            response_lower = response_text.lower()
-            has_external = any(platform in response_lower for platform in external_platforms)
+            # Slower than usual: race a duplicate request on the backup model
+            metrics.increment("llm.hedged")
+            hedge = asyncio.ensure_future(self._timed_generate(None, full_prompt, backup))
+            tasks.add(hedge)
             
-            if has_external:
-                # Response contains external courses, reject it completely
-                # Return a hardcoded response with actual courses
-                return """I can only recommend courses from our catalog. Here are our AI courses for beginners:
-
-1. **Introduction to Artificial Intelligence** (Beginner, 40h) - Perfect for beginners, covers fundamentals of AI, machine learning, and neural networks.
-
-2. **Advanced Machine Learning with Python** (Advanced, 60h) - Deep dive into ML algorithms and real-world applications.
-
-3. **Deep Learning and Neural Networks** (Advanced, 70h) - Build and train deep learning models using TensorFlow and PyTorch.
-
-Would you like to enroll in any of these courses?"""
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.increment("llm.hedge_wins")
+                        return task.result()
             
-            return response_text
+            # Both failed
+            raise primary.exception()
+        finally:
+            # The loser (or everything, if we were cancelled) is no longer needed
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def _get_token_writer(self):
+        """Get the graph's stream writer if this run streams tokens, else None"""
+        try:
+            config = get_config()
+        except RuntimeError:
+            # Not running inside a graph
+            return None
         
-        elif model.startswith("bedrock"):
-            response = llm.invoke(full_prompt)
-            return response.content if hasattr(response, 'content') else str(response)
+        if not config.get("configurable", {}).get("stream_tokens"):
+            return None
         
-        elif model == "mistral":
-            response = llm.invoke(full_prompt)
-            return response.content if hasattr(response, 'content') else str(response)
+        writer = get_stream_writer()
+        node = config.get("metadata", {}).get("langgraph_node")
+        return lambda event: writer({**event, "node": node})
+    
+    async def _stream_llm_response(self, llm, full_prompt: str, model: str, token_writer, apply_guard: bool) -> str:
+        """Stream LLM tokens to the client while applying the external-platform guard"""
         
-        else:
-            return "Model not supported"
+        # Each chunk is scanned once; characters that could still be the start
+        # of a blocked term are held back until the next chunk decides
+        scanner = get_guard().scanner() if apply_guard else None
+        
+        response_text = ""
+        emitted = 0  # Characters already sent to the client
+        
+        async for chunk in stream_text(llm, model, full_prompt):
+            response_text += chunk
+            
+            if scanner and scanner.feed(chunk):
+                # Stop generating and replace whatever was already shown
+                metrics.increment("guard.blocked")
+                token_writer({"type": "token_reset", "content": CATALOG_ONLY_RESPONSE})
+                return CATALOG_ONLY_RESPONSE
+            
+            safe_end = len(response_text) - (scanner.pending if scanner else 0)
+            if safe_end > emitted:
+                token_writer({"type": "token", "content": response_text[emitted:safe_end]})
+                emitted = safe_end
+        
+        if len(response_text) > emitted:
+            token_writer({"type": "token", "content": response_text[emitted:]})
+        
+        return response_text
     
 
-
-    
     # ===== PHASE 3 METHODS =====
     
     async def _llm_based_router_node(self, state: AgentState, model_name: str) -> Dict[str, Any]:
         """Phase 3: LLM-based routing instead of keyword matching"""
         
         message = state["message"]
-        llm = get_model(model_name)
+        
+        cache_key = (normalize_message(message), model_name)
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+        
+        # Routing may use the budget only down to what the response stage needs
+        remaining = self._remaining_budget(state)
+        timeout = None if remaining is None else max(0.0, remaining - self.optional_stage_min_budget)
+        
+        if self.router_batch_enabled:
+            try:
+                # Classified in one LLM call with the other messages of this batch window;
+                # the batch has its own timeout, so wait only as long as this request can
+                decision = await asyncio.wait_for(self._get_router_batcher(model_name).submit(message), timeout=timeout)
+            except asyncio.TimeoutError:
+                if self._budget_low(state):
+                    return await self._router_cut_off(state)
+                return await self._router_node(state)
+            except Exception:
+                return await self._router_node(state)
+            
+            self.route_cache.put(cache_key, decision)
+            self._log_route_decision(message, decision, "llm", model_name)
+            return decision
         
         routing_prompt = f"""Analyze the user's message and determine their intent.
 
@@ -988,50 +1305,145 @@ Determine:
 Respond with: intent, confidence, reasoning, requires_approval"""
         
         try:
-            # Try LLM-based routing
-            response = await self._get_llm_response(llm, routing_prompt, model_name)
-            
-            # Parse response (simplified)
-            message_lower = message.lower()
-            
-            if "enroll" in response.lower() or "enroll" in message_lower:
-                return {
-                    "route": "enrollment",
-                    "route_reasoning": "LLM detected enrollment intent",
-                    "route_confidence": 0.9,
-                    "requires_approval": "all" in message_lower or "bulk" in message_lower
-                }
-            elif "recommend" in response.lower() or "suggest" in response.lower():
-                return {
-                    "route": "recommendation",
-                    "route_reasoning": "LLM detected recommendation request",
-                    "route_confidence": 0.85,
-                    "requires_approval": False
-                }
-            elif "compare" in message_lower or "analyze" in message_lower or "detailed" in message_lower:
-                return {
-                    "route": "complex_query",
-                    "route_reasoning": "Complex query requiring decomposition",
-                    "route_confidence": 0.8,
-                    "requires_approval": False
-                }
-            elif any(word in message_lower for word in ["show", "list", "browse", "search"]):
-                return {
-                    "route": "course_discovery",
-                    "route_reasoning": "LLM detected discovery intent",
-                    "route_confidence": 0.8,
-                    "requires_approval": False
-                }
-            else:
-                return {
-                    "route": "general_qa",
-                    "route_reasoning": "General question",
-                    "route_confidence": 0.7,
-                    "requires_approval": False
-                }
-        except Exception as e:
+            # Try LLM-based routing (fails fast while the provider's circuit is open)
+            llm = get_model(model_name)
+            # Routing output is never shown to the user, so it skips the response guard
+            response = await asyncio.wait_for(
+                self._get_llm_response(llm, routing_prompt, model_name, guard=False), timeout=timeout
+            )
+            decision = self._parse_llm_route(response, message)
+        except RequestBudgetExceeded:
+            return await self._router_cut_off(state)
+        except asyncio.TimeoutError:
+            if self._budget_low(state):
+                # Our cap, not a provider timeout
+                return await self._router_cut_off(state)
+            return await self._router_node(state)
+        except Exception:
             # Fallback to rule-based
             return await self._router_node(state)
+        
+        self.route_cache.put(cache_key, decision)
+        
+        # Keep the LLM's decision as a training label for the local classifier
+        self._log_route_decision(message, decision, "llm", model_name)
+        return decision
+    
+    async def _router_cut_off(self, state: AgentState) -> Dict[str, Any]:
+        """Keyword routing after the LLM router ran out of time, reported as a skipped stage"""
+        decision = await self._router_node(state)
+        return {**decision, "skipped_stages": self._skip_stage(state, "llm_router")}
+    
+    def _get_router_batcher(self, model_name: str) -> MicroBatcher:
+        """Routing batcher for a model (one batch = one LLM call)"""
+        batcher = self._router_batchers.get(model_name)
+        if batcher is None:
+            batcher = MicroBatcher(
+                "router.batch",
+                lambda messages: self._route_batch(messages, model_name),
+                self.router_batch_window_ms,
+                self.router_batch_max_size
+            )
+            self._router_batchers[model_name] = batcher
+        return batcher
+    
+    async def _route_batch(self, messages: list[str], model_name: str) -> list[Dict[str, Any]]:
+        """Route several messages with one structured LLM call
+        
+        Runs outside any single request's graph context (see MicroBatcher), so it is
+        bounded by router_batch_timeout rather than by one caller's deadline.
+        """
+        
+        llm = get_model(model_name)
+        numbered = "\n".join(f"{i}. {json.dumps(message)}" for i, message in enumerate(messages, 1))
+        
+        routing_prompt = f"""Analyze each numbered user message and determine its intent.
+
+User messages:
+{numbered}
+
+Available intents:
+- course_discovery: User wants to browse, search, or learn about courses
+- enrollment: User wants to enroll in a course
+- recommendation: User wants personalized course recommendations
+- general_qa: General questions about the platform or courses
+- complex_query: Complex multi-step query requiring decomposition
+
+For every message determine:
+1. Primary intent
+2. Confidence (0.0 to 1.0)
+3. Does this require human approval? (e.g., bulk enrollments >3 courses)
+4. Reasoning for this choice
+
+Respond with JSON only, one decision per message:
+{{"decisions": [{{"index": 1, "intent": "...", "confidence": 0.9, "reasoning": "...", "requires_approval": false}}]}}"""
+        
+        response = await asyncio.wait_for(
+            self._get_llm_response(llm, routing_prompt, model_name, guard=False),
+            timeout=self.router_batch_timeout
+        )
+        
+        # Tolerate prose or code fences around the JSON object
+        start, end = response.find("{"), response.rfind("}")
+        batch = RouteDecisionBatch.model_validate_json(response[start:end + 1])
+        by_index = {d.index: d for d in batch.decisions}
+        
+        decisions = []
+        for i, message in enumerate(messages, 1):
+            d = by_index.get(i)
+            if d is None:
+                # Missing from the LLM's answer: keyword routing for this message only
+                decisions.append(await self._router_node({"message": message}))
+                continue
+            decisions.append({
+                "route": d.intent,
+                "route_reasoning": d.reasoning,
+                "route_confidence": d.confidence,
+                "requires_approval": d.requires_approval
+            })
+        return decisions
+    
+    def _parse_llm_route(self, response: str, message: str) -> Dict[str, Any]:
+        """Turn the LLM router's answer into a routing decision"""
+        
+        # Parse response (simplified)
+        message_lower = message.lower()
+        
+        if "enroll" in response.lower() or "enroll" in message_lower:
+            return {
+                "route": "enrollment",
+                "route_reasoning": "LLM detected enrollment intent",
+                "route_confidence": 0.9,
+                "requires_approval": "all" in message_lower or "bulk" in message_lower
+            }
+        elif "recommend" in response.lower() or "suggest" in response.lower():
+            return {
+                "route": "recommendation",
+                "route_reasoning": "LLM detected recommendation request",
+                "route_confidence": 0.85,
+                "requires_approval": False
+            }
+        elif "compare" in message_lower or "analyze" in message_lower or "detailed" in message_lower:
+            return {
+                "route": "complex_query",
+                "route_reasoning": "Complex query requiring decomposition",
+                "route_confidence": 0.8,
+                "requires_approval": False
+            }
+        elif any(word in message_lower for word in ["show", "list", "browse", "search"]):
+            return {
+                "route": "course_discovery",
+                "route_reasoning": "LLM detected discovery intent",
+                "route_confidence": 0.8,
+                "requires_approval": False
+            }
+        else:
+            return {
+                "route": "general_qa",
+                "route_reasoning": "General question",
+                "route_confidence": 0.7,
+                "requires_approval": False
+            }
     
     async def _evaluator_node(self, state: AgentState, model_name: str) -> Dict[str, Any]:
         """Phase 3: Evaluate response quality"""
@@ -1071,6 +1483,14 @@ Respond with: intent, confidence, reasoning, requires_approval"""
         
         quality_score = min(quality_score, 1.0)
         
+        if quality_score < 0.7 and not state.get("response_cache_hit") and self._budget_low(state):
+            # Refinement would not fit in the remaining budget
+            return {
+                "quality_score": quality_score,
+                "draft_response": response,
+                "skipped_stages": self._skip_stage(state, "optimizer")
+            }
+        
         return {
             "quality_score": quality_score,
             "draft_response": response
@@ -1083,6 +1503,14 @@ Respond with: intent, confidence, reasoning, requires_approval"""
         message = state["message"]
         refinement_count = state.get("refinement_count", 0)
         
+        if self._budget_low(state):
+            # Keep the draft rather than start a refinement that can't finish in time
+            return {
+                "response": draft_response,
+                "refinement_count": self.max_refinements,
+                "skipped_stages": self._skip_stage(state, "optimizer")
+            }
+        
         llm = get_model(model_name)
         
         refinement_prompt = f"""Improve this response to make it better.
@@ -1100,23 +1528,30 @@ Make it:
 Provide an improved version (keep it concise but helpful)."""
         
         try:
-            improved_response = await self._get_llm_response(llm, refinement_prompt, model_name)
+            improved_response = await self._get_llm_response(llm, refinement_prompt, model_name, stream_tokens=True)
             
             return {
                 "response": improved_response,
                 "refinement_count": refinement_count + 1
             }
-        except Exception as e:
+        except RequestBudgetExceeded:
             return {
                 "response": draft_response,
-                "refinement_count": refinement_count + 1
+                "refinement_count": self.max_refinements,
+                "skipped_stages": self._skip_stage(state, "optimizer")
+            }
+        except Exception:
+            # The draft was never refined, so it must not be cached as a final response
+            return {
+                "response": draft_response,
+                "refinement_count": refinement_count + 1,
+                "response_cache_key": None
             }
     
     async def _orchestrator_node(self, state: AgentState, model_name: str) -> Dict[str, Any]:
         """Phase 3: Decompose complex queries into subtasks"""
         
         message = state["message"]
-        courses = state.get("courses", [])
         
         # Create subtasks for complex query
         subtasks = [
@@ -1149,7 +1584,7 @@ Provide an improved version (keep it concise but helpful)."""
         """Phase 3: Execute subtasks in parallel"""
         
         subtasks = state.get("subtasks", [])
-        courses = state.get("courses", [])
+        courses = await course_catalog.get_courses()
         message = state["message"]
         
         if not subtasks:
@@ -1187,6 +1622,16 @@ Provide a concise result for this specific subtask."""
         # PARALLELIZATION: Run all subtasks concurrently
         results = await asyncio.gather(*[execute_subtask(task) for task in subtasks])
         
+        if self._budget_low(state):
+            # No time for a synthesis call: answer with the subtask results as they are
+            completed = [r for r in results if r["status"] == "completed"]
+            if completed:
+                return {
+                    "subtask_results": results,
+                    "response": "\n\n".join(r["result"] for r in completed),
+                    "skipped_stages": self._skip_stage(state, "synthesis")
+                }
+        
         # Synthesize results
         synthesis_prompt = f"""Synthesize these subtask results into a comprehensive response.
 
@@ -1197,7 +1642,7 @@ Subtask Results:
 
 Provide a well-structured, comprehensive response."""
         
-        final_response = await self._get_llm_response(llm, synthesis_prompt, model_name)
+        final_response = await self._get_llm_response(llm, synthesis_prompt, model_name, stream_tokens=True)
         
         return {
             "subtask_results": results,
@@ -1209,7 +1654,7 @@ Provide a well-structured, comprehensive response."""
         
         requires_approval = state.get("requires_approval", False)
         message = state["message"].lower()
-        courses = state.get("courses", [])
+        courses = await course_catalog.get_courses()
         
         # Check for bulk enrollment (>3 courses)
         if "enroll" in message:
@@ -1275,6 +1720,14 @@ Provide a well-structured, comprehensive response."""
         quality_score = state.get("quality_score", 0.0)
         refinement_count = state.get("refinement_count", 0)
         
+        # Cached responses were already evaluated and refined when first generated
+        if state.get("response_cache_hit"):
+            return "acceptable"
+        
+        # Refinement skipped for lack of time
+        if "optimizer" in state.get("skipped_stages", []):
+            return "acceptable"
+        
         # Accept if quality is good OR we've tried enough times
         if quality_score >= 0.7 or refinement_count >= self.max_refinements:
             return "acceptable"
@@ -1289,3 +1742,12 @@ Provide a well-structured, comprehensive response."""
             return "max_refinements"
         else:
             return "re_evaluate"
+
+
+# Process-wide agent runtime shared by all routers: one graph cache and one checkpointer
+lms_agent = LMSAgent()
+
+# Share of messages routed without an LLM call
+metrics.register_gauge("router.fast_path_hit_rate", lambda: metrics.ratio("router.fast_path", "router.total"))
+# Messages per batched routing call (ROUTER_BATCH_ENABLED)
+metrics.register_gauge("router.batch.avg_size", lambda: metrics.ratio("router.batch.items", "router.batch.batches"))
@@ -0,0 +1,72 @@
+"""
+Aho-Corasick multi-pattern matcher
+One pass over the text finds every pattern, regardless of how many patterns
+there are. Scanning can be resumed chunk by chunk (e.g. over a token stream).
+"""
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton: one pass over the text finds every pattern in it"""
+
+    def __init__(self, patterns):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[str]] = [set()]
+        self._depth: List[int] = [0]  # Length of the pattern prefix each state represents
+
+        for pattern in set(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                    self._depth.append(self._depth[state] + 1)
+                    self._goto[state][char] = nxt
+                state = nxt
+            self._out[state].add(pattern)
+
+        # Breadth-first failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def _next(self, state: int, char: str) -> int:
+        while state and char not in self._goto[state]:
+            state = self._fail[state]
+        return self._goto[state].get(char, 0)
+
+    def find(self, text: str) -> Set[str]:
+        """All patterns that occur anywhere in text"""
+        found: Set[str] = set()
+        state = 0
+        for char in text:
+            state = self._next(state, char)
+            if self._out[state]:
+                found |= self._out[state]
+        return found
+
+    def scan(self, text: str, state: int = 0) -> Tuple[int, bool]:
+        """Continue scanning from state; returns (new state, whether any pattern ended in text)"""
+        for char in text:
+            state = self._next(state, char)
+            if self._out[state]:
+                return state, True
+        return state, False
+
+    def depth(self, state: int) -> int:
+        """Trailing characters that could still grow into a pattern"""
+        return self._depth[state]
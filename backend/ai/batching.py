@@ -0,0 +1,70 @@
+"""
+Micro-batching for concurrent requests
+Items submitted within a short window (or until the batch is full) are handled
+by one call, and each caller gets back its own result.
+"""
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, List, Optional
+
+from ai import metrics
+
+
+class MicroBatcher:
+    """Collects items for up to window_ms (or max_size items) and processes them together
+
+    handler receives the list of items and must return one result per item, in order.
+    It runs in an empty context, so it never sees the context variables (e.g. the
+    LangGraph run config and its deadline) of whichever caller happened to submit first.
+    """
+
+    def __init__(self, name: str, handler: Callable[[List[Any]], Awaitable[List[Any]]], window_ms: float, max_size: int):
+        self.name = name  # Prefix for this batcher's metrics
+        self.handler = handler
+        self.window = window_ms / 1000
+        self.max_size = max(1, max_size)
+        self._pending: List[tuple] = []  # (item, future)
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush, context=contextvars.Context())
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            # The task copies the current context, so create it inside an empty one
+            contextvars.Context().run(asyncio.ensure_future, self._run(batch))
+
+    async def _run(self, batch: List[tuple]):
+        metrics.increment(f"{self.name}.batches")
+        metrics.increment(f"{self.name}.items", len(batch))
+
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():  # Caller may have been cancelled meanwhile
+                continue
+            if index < len(results):
+                future.set_result(results[index])
+            else:
+                future.set_exception(ValueError(f"{self.name}: no result for batch item {index}"))
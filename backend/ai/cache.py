@@ -0,0 +1,129 @@
+"""
+In-process caches for agent results
+- TTLCache: bounded LRU with per-entry TTL and hit/miss/eviction counters
+- ResponseCache: final responses keyed by normalized message, route, model and
+  catalog version, with an optional n-gram similarity lookup for near-duplicates
+"""
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from ai import metrics
+from ai.intent_classifier import extract_features
+
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))  # 0 = exact matches only
+
+_WORD_RE = re.compile(r"[a-z0-9+#]+")
+_SIMILARITY_DIM = 2 ** 14
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase and drop punctuation/extra whitespace ("Show Docker courses!" -> "show docker courses")"""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after ttl_seconds"""
+
+    def __init__(self, name: str, max_size: int, ttl_seconds: float):
+        self.name = name  # Prefix for this cache's metrics
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, value)
+
+        metrics.register_gauge(f"{name}.size", lambda: len(self._entries))
+        metrics.register_gauge(f"{name}.hit_rate", lambda: metrics.ratio(f"{name}.hits", f"{name}.lookups"))
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[Any]:
+        """Cached value, or None if missing or expired"""
+        if count:
+            metrics.increment(f"{self.name}.lookups")
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            metrics.increment(f"{self.name}.expirations")
+            entry = None
+
+        if entry is None:
+            if count:
+                metrics.increment(f"{self.name}.misses")
+            return None
+
+        self._entries.move_to_end(key)
+        if count:
+            metrics.increment(f"{self.name}.hits")
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            metrics.increment(f"{self.name}.evictions")
+
+    def items(self):
+        """Live (key, value) pairs, most recently used last"""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in self._entries.items() if expires_at > now]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResponseCache:
+    """Final agent responses for catalog Q&A, discovery and recommendations"""
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.similarity = similarity
+        self._cache = TTLCache("response_cache", max_size, ttl_seconds)
+
+    @staticmethod
+    def key(message: str, route: str, model: str, catalog_version: int) -> Tuple[str, str, str, int]:
+        return (normalize_message(message), route, model, catalog_version)
+
+    def get(self, key: Tuple[str, str, str, int]) -> Optional[str]:
+        """Cached response for key, falling back to the most similar cached message"""
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry[0]
+
+        if self.similarity <= 0 or not key[0]:
+            return None
+
+        # Near-duplicate lookup among entries for the same route, model and catalog version
+        features = extract_features(key[0], _SIMILARITY_DIM)
+        best_key, best_score = None, self.similarity
+        for other_key, (_, other_features) in self._cache.items():
+            if other_key[1:] != key[1:]:
+                continue
+            score = sum(v * other_features.get(i, 0.0) for i, v in features.items())
+            if score >= best_score:
+                best_key, best_score = other_key, score
+
+        if best_key is None:
+            return None
+
+        metrics.increment("response_cache.similar_hits")
+        entry = self._cache.get(best_key, count=False)
+        return entry[0] if entry else None
+
+    def put(self, key: Tuple[str, str, str, int], response: str) -> None:
+        if not response:
+            return
+        features = extract_features(key[0], _SIMILARITY_DIM) if self.similarity > 0 else {}
+        self._cache.put(key, (response, features))
+
+
+# Shared by all graphs in this process
+response_cache = ResponseCache()
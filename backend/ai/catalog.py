@@ -0,0 +1,192 @@
+"""
+Process-level course catalog cache
+The catalog only changes through create_course, so chat traffic and the
+/api/courses endpoints read from memory. Every change bumps a monotonic
+catalog version; other uvicorn workers are told via Postgres LISTEN/NOTIFY.
+"""
+import asyncio
+import uuid
+from typing import Optional, List, Dict, Any, Callable
+import asyncpg
+from tortoise import Tortoise
+
+from ai import metrics
+
+
+CATALOG_CHANNEL = "lms_catalog_changed"
+
+# Per-course line formats used in agent prompts
+PROMPT_FORMATS = {
+    "discovery": "- **{title}** ({difficulty}, {duration_hours}h)\n  {description}",
+    "recommendation": "- {title} ({difficulty}, {duration_hours}h, {category})",
+    "general_qa": "- {title} ({category}, {difficulty})"
+}
+
+
+class CourseCatalog:
+    """Versioned in-memory copy of the courses table"""
+
+    def __init__(self):
+        self.version = 0  # Bumped on every invalidation, never reset
+        self.instance_id = uuid.uuid4().hex  # Lets us ignore our own notifications
+        self._courses: Optional[List[Dict[str, Any]]] = None
+        self._records: Optional[list] = None
+        self._by_id: Dict[int, Any] = {}
+        self._prompt_lines: Dict[str, Dict[int, str]] = {}  # format -> course id -> line
+        self._prompt_blocks: Dict[str, str] = {}  # format -> whole-catalog rendering
+        self._derived: Dict[str, Any] = {}  # name -> index built from this catalog version
+        self._lock = asyncio.Lock()
+        self._listen_task: Optional[asyncio.Task] = None
+
+    async def get_courses(self) -> List[Dict[str, Any]]:
+        """All courses as plain dicts (the shape agent tools and nodes use)"""
+        await self._ensure_loaded()
+        return self._courses
+
+    async def get_records(self) -> list:
+        """All courses as Course_Pydantic records (the shape the API returns)"""
+        await self._ensure_loaded()
+        return self._records
+
+    async def get_record(self, course_id: int):
+        """A single Course_Pydantic record, or None"""
+        await self._ensure_loaded()
+        return self._by_id.get(course_id)
+
+    async def render(self, fmt: str, course_ids: Optional[List[int]] = None) -> str:
+        """Catalog listing for prompts, rendered once per catalog version and format
+        
+        With course_ids, only those courses are listed (in the given order).
+        """
+        await self._ensure_loaded()
+        
+        lines = self._prompt_lines.get(fmt)
+        if lines is None:
+            template = PROMPT_FORMATS[fmt]
+            lines = {course["id"]: template.format(**course) for course in self._courses}
+            self._prompt_lines[fmt] = lines
+        
+        if course_ids is not None:
+            return "\n".join(lines[i] for i in course_ids if i in lines)
+        
+        block = self._prompt_blocks.get(fmt)
+        if block is None:
+            block = "\n".join(lines.values())
+            self._prompt_blocks[fmt] = block
+        return block
+
+    async def derived(self, name: str, build: Callable[[List[Dict[str, Any]]], Any]):
+        """Lookup structure built from the courses once per catalog version"""
+        await self._ensure_loaded()
+        
+        value = self._derived.get(name)
+        if value is None:
+            value = build(self._courses)
+            self._derived[name] = value
+        return value
+
+    def invalidate(self):
+        """Drop the cached catalog and start a new catalog version"""
+        self.version += 1
+        self._courses = None
+        self._records = None
+        self._by_id = {}
+        self._prompt_lines = {}
+        self._prompt_blocks = {}
+        self._derived = {}
+
+    async def notify_change(self):
+        """Invalidate locally and tell the other workers the catalog changed"""
+        self.invalidate()
+        try:
+            conn = Tortoise.get_connection("default")
+            if conn.capabilities.dialect != "postgres":
+                return
+            await conn.execute_query("SELECT pg_notify($1, $2)", [CATALOG_CHANNEL, self.instance_id])
+        except Exception as e:
+            print(f"⚠️ Could not publish catalog change: {e}")
+
+    async def _ensure_loaded(self):
+        if self._courses is not None:
+            return
+
+        async with self._lock:
+            # Reload until no invalidation raced with the query
+            while self._courses is None:
+                version = self.version
+                courses, records = await self._load()
+                if version == self.version:
+                    self._courses = courses
+                    self._records = records
+                    self._by_id = {record.id: record for record in records}
+
+    async def _load(self):
+        from models import Course, Course_Pydantic
+
+        metrics.increment("catalog.reloads")
+        rows = await Course.all().order_by("id")
+        courses = [
+            {
+                "id": c.id,
+                "title": c.title,
+                "description": c.description,
+                "category": c.category,
+                "difficulty": c.difficulty,
+                "duration_hours": c.duration_hours
+            }
+            for c in rows
+        ]
+        records = [Course_Pydantic.model_validate(c) for c in rows]
+        return courses, records
+
+    # ===== CROSS-WORKER INVALIDATION =====
+
+    def start_listener(self, db_url: str):
+        """Listen for catalog changes made by other workers (Postgres only)"""
+        if not db_url.startswith(("postgres://", "postgresql://")):
+            return
+        if self._listen_task is None:
+            self._listen_task = asyncio.create_task(self._listen_forever(db_url))
+
+    async def stop_listener(self):
+        if self._listen_task:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        if payload != self.instance_id:
+            metrics.increment("catalog.remote_invalidations")
+            self.invalidate()
+
+    async def _listen_forever(self, db_url: str):
+        """Keep a LISTEN connection open, reconnecting if it drops"""
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(db_url)
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda c: closed.set())
+                await conn.add_listener(CATALOG_CHANNEL, self._on_notify)
+
+                # Changes may have been missed while we were not listening
+                self.invalidate()
+                await closed.wait()
+            except asyncio.CancelledError:
+                if conn and not conn.is_closed():
+                    await conn.close()
+                raise
+            except Exception as e:
+                print(f"⚠️ Catalog listener error: {e}")
+
+            self.invalidate()
+            await asyncio.sleep(5)
+
+
+# Shared by the agent and the course API in this process
+course_catalog = CourseCatalog()
+
+metrics.register_gauge("catalog.version", lambda: course_catalog.version)
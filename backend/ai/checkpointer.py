@@ -0,0 +1,651 @@
+"""
+LangGraph checkpointers for the agent
+- PostgresCheckpointer: checkpoints, channel values and pending writes in indexed tables
+  of the application database (Tortoise ORM); writes from concurrent runs are
+  group-committed, one transaction per batch
+- MemoryCheckpointer: in-process fallback (CHECKPOINT_BACKEND=memory) with the same thread API
+- CheckpointRetention: both keep the last N checkpoints per thread, evict idle threads
+  after a TTL and evict least recently active threads to stay within a byte budget
+"""
+import abc
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from tortoise import timezone as tortoise_timezone
+from tortoise.expressions import F, Q
+from tortoise.functions import Count, Length, Sum
+from tortoise.transactions import in_transaction
+
+from ai import metrics
+from ai.batching import MicroBatcher
+from models import CheckpointBlob, CheckpointRecord, CheckpointThread, CheckpointWrite
+
+
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "postgres")  # postgres or memory
+# sync: a graph step completes once its checkpoint is committed
+# async: commits happen in the background, so a crash can lose the last batch
+CHECKPOINT_DURABILITY = os.getenv("CHECKPOINT_DURABILITY", "sync")
+CHECKPOINT_BATCH_WINDOW_MS = float(os.getenv("CHECKPOINT_BATCH_WINDOW_MS", "5"))
+CHECKPOINT_BATCH_MAX_SIZE = int(os.getenv("CHECKPOINT_BATCH_MAX_SIZE", "64"))
+
+# Retention (0 disables each limit)
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "20"))
+CHECKPOINT_THREAD_TTL_SECONDS = float(os.getenv("CHECKPOINT_THREAD_TTL_SECONDS", "604800"))
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", "268435456"))
+CHECKPOINT_SWEEP_SECONDS = float(os.getenv("CHECKPOINT_SWEEP_SECONDS", "60"))
+
+_HISTORY_PAGE_SIZE = 100
+_EVICT_PAGE_SIZE = 500
+
+# Unique columns per table, and the columns overwritten when a row is written again
+_KEYS = {
+    CheckpointThread: ("thread_id",),
+    CheckpointRecord: ("thread_id", "checkpoint_ns", "checkpoint_id"),
+    CheckpointBlob: ("thread_id", "checkpoint_ns", "channel", "version"),
+    CheckpointWrite: ("thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx"),
+}
+_UPDATE_FIELDS = {
+    CheckpointThread: ("updated_at",),
+    CheckpointRecord: ("parent_checkpoint_id", "type", "checkpoint", "metadata_type", "metadata"),
+    CheckpointWrite: ("task_path", "channel", "type", "blob"),
+}
+
+
+def next_version(current: Optional[str]) -> str:
+    """Monotonic channel version string (same scheme as LangGraph's InMemorySaver)"""
+    if current is None:
+        current_v = 0
+    elif isinstance(current, int):
+        current_v = current
+    else:
+        current_v = int(current.split(".")[0])
+    return f"{current_v + 1:032}.{random.random():016}"
+
+
+class CheckpointRetention:
+    """Limits applied by the checkpointers"""
+
+    def __init__(self, keep_last: int = CHECKPOINT_KEEP_LAST, thread_ttl_seconds: float = CHECKPOINT_THREAD_TTL_SECONDS,
+                 max_bytes: int = CHECKPOINT_MAX_BYTES):
+        self.keep_last = keep_last  # Checkpoints kept per thread (older ones can't be replayed)
+        self.thread_ttl_seconds = thread_ttl_seconds  # Threads idle this long are deleted
+        self.max_bytes = max_bytes  # Budget for serialized checkpoint data, least recently active threads go first
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"keep_last": self.keep_last, "thread_ttl_seconds": self.thread_ttl_seconds, "max_bytes": self.max_bytes}
+
+
+class _RetentionSweeper(abc.ABC):
+    """Periodic aenforce_retention() so idle threads expire without new traffic"""
+
+    _sweep_task: Optional[asyncio.Task] = None
+
+    def start_sweeper(self, interval: float = CHECKPOINT_SWEEP_SECONDS):
+        if self._sweep_task is None and interval > 0:
+            self._sweep_task = asyncio.create_task(self._sweep_forever(interval))
+
+    async def stop_sweeper(self):
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+
+    async def _sweep_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.aenforce_retention()
+            except Exception as e:
+                print(f"⚠️ Checkpoint retention sweep failed: {e}")
+
+    @abc.abstractmethod
+    async def aenforce_retention(self) -> None:
+        """Apply the retention limits once"""
+
+
+class PostgresCheckpointer(_RetentionSweeper, BaseCheckpointSaver[str]):
+    """Durable checkpoints shared by all workers; async API only"""
+
+    def __init__(self, durability: str = CHECKPOINT_DURABILITY, window_ms: float = CHECKPOINT_BATCH_WINDOW_MS,
+                 max_batch: int = CHECKPOINT_BATCH_MAX_SIZE, retention: Optional[CheckpointRetention] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.durability = durability
+        self.retention = retention or CheckpointRetention()
+        self._batcher = MicroBatcher("checkpoint.batch", self._commit, window_ms, max_batch)
+        self._pending: Dict[str, set] = {}  # thread_id -> background writes not yet committed
+        self._maintenance: set = set()  # Background prune tasks
+
+        metrics.register_gauge("checkpoint.pending_writes", lambda: sum(len(p) for p in self._pending.values()))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return next_version(current)
+
+    # Writes
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+
+        blobs = []
+        for channel, version in new_versions.items():
+            type_, blob = self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)
+            blobs.append(CheckpointBlob(
+                thread_id=thread_id, checkpoint_ns=checkpoint_ns, channel=channel,
+                version=str(version), type=type_, blob=blob
+            ))
+
+        type_, data = self.serde.dumps_typed(c)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        record = CheckpointRecord(
+            thread_id=thread_id, checkpoint_ns=checkpoint_ns, checkpoint_id=checkpoint["id"],
+            parent_checkpoint_id=config["configurable"].get("checkpoint_id"),
+            type=type_, checkpoint=data, metadata_type=metadata_type, metadata=metadata_data
+        )
+        size = len(data) + len(metadata_data) + sum(len(blob.blob or b"") for blob in blobs)
+
+        await self._write(thread_id, [
+            (CheckpointBlob, blobs, False),
+            (CheckpointRecord, [record], True),
+            (CheckpointThread, [self._thread_row(thread_id, size)], True),
+        ])
+
+        # Prune a thread about once per keep_last checkpoints, off the request path
+        if self.retention.keep_last > 0 and random.random() * self.retention.keep_last < 1:
+            task = asyncio.ensure_future(self._prune_thread(thread_id, checkpoint_ns))
+            self._maintenance.add(task)
+            task.add_done_callback(self._maintenance_done)
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        # Special channels (errors, interrupts) replace earlier writes; regular writes keep the first one
+        replace, keep = [], []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            type_, blob = self.serde.dumps_typed(value)
+            row = CheckpointWrite(
+                thread_id=thread_id, checkpoint_ns=checkpoint_ns, checkpoint_id=checkpoint_id,
+                task_id=task_id, task_path=task_path, idx=idx, channel=channel, type=type_, blob=blob
+            )
+            (replace if idx < 0 else keep).append(row)
+
+        size = sum(len(row.blob) for row in keep + replace)
+        await self._write(thread_id, [
+            (CheckpointWrite, keep, False),
+            (CheckpointWrite, replace, True),
+            (CheckpointThread, [self._thread_row(thread_id, size)], True),
+        ])
+
+    @staticmethod
+    def _thread_row(thread_id: str, size: int) -> CheckpointThread:
+        """Thread activity row; size_bytes carries the bytes this write adds (applied in _commit)"""
+        return CheckpointThread(thread_id=thread_id, updated_at=tortoise_timezone.now(), size_bytes=size)
+
+    async def _write(self, thread_id: str, ops: List[tuple]) -> None:
+        metrics.increment("checkpoint.writes")
+        if self.durability != "async":
+            await self._batcher.submit(ops)
+            return
+
+        future = asyncio.ensure_future(self._batcher.submit(ops))
+        self._pending.setdefault(thread_id, set()).add(future)
+        future.add_done_callback(lambda done: self._write_done(thread_id, done))
+
+    def _write_done(self, thread_id: str, future: asyncio.Future):
+        pending = self._pending.get(thread_id)
+        if pending is not None:
+            pending.discard(future)
+            if not pending:
+                del self._pending[thread_id]
+        if not future.cancelled() and future.exception() is not None:
+            metrics.increment("checkpoint.write_errors")
+            print(f"⚠️ Checkpoint write for thread {thread_id} failed: {future.exception()}")
+
+    async def _commit(self, batch: List[List[tuple]]) -> List[None]:
+        """Write every queued row in one transaction, one bulk insert per table and conflict mode"""
+        grouped: Dict[tuple, Dict[tuple, Any]] = {}
+        added: Dict[str, int] = {}  # thread_id -> bytes written in this batch
+        for ops in batch:
+            for model, rows, overwrite in ops:
+                unique = grouped.setdefault((model, overwrite), {})
+                for row in rows:
+                    if model is CheckpointThread:
+                        # Sizes are added to the stored total below, never written as-is
+                        added[row.thread_id] = added.get(row.thread_id, 0) + row.size_bytes
+                        row.size_bytes = 0
+                    key = tuple(getattr(row, column) for column in _KEYS[model])
+                    # A statement may not touch the same row twice: last write wins, or first if kept
+                    if overwrite or key not in unique:
+                        unique[key] = row
+
+        async with in_transaction() as connection:
+            for (model, overwrite), unique in grouped.items():
+                if not unique:
+                    continue
+                if overwrite:
+                    await model.bulk_create(
+                        list(unique.values()), on_conflict=_KEYS[model],
+                        update_fields=_UPDATE_FIELDS[model], using_db=connection
+                    )
+                else:
+                    await model.bulk_create(list(unique.values()), ignore_conflicts=True, using_db=connection)
+
+            # Incremental, so every thread has a current size without being measured
+            for thread_id, size in added.items():
+                if size:
+                    await CheckpointThread.filter(thread_id=thread_id).using_db(connection).update(
+                        size_bytes=F("size_bytes") + size
+                    )
+
+        metrics.increment("checkpoint.commits")
+        return [None] * len(batch)
+
+    async def _settle(self, thread_id: Optional[str] = None) -> None:
+        """Wait for background writes (of one thread, or all) so reads see them"""
+        if thread_id is None:
+            futures = [future for pending in self._pending.values() for future in pending]
+        else:
+            futures = list(self._pending.get(thread_id, ()))
+        if futures:
+            await asyncio.gather(*futures, return_exceptions=True)
+
+    async def aflush(self) -> None:
+        """Commit all background writes and prunes (call before shutdown)"""
+        await self._settle()
+        if self._maintenance:
+            await asyncio.gather(*self._maintenance, return_exceptions=True)
+
+    # Retention
+
+    def _maintenance_done(self, task: asyncio.Task):
+        self._maintenance.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Checkpoint pruning failed: {task.exception()}")
+
+    async def _prune_thread(self, thread_id: str, checkpoint_ns: str) -> None:
+        """Drop checkpoints beyond the newest keep_last, with their writes and unreferenced blobs"""
+        await self._settle(thread_id)
+        keep = self.retention.keep_last
+        kept = []
+        if keep > 0:
+            kept = await CheckpointRecord.filter(
+                thread_id=thread_id, checkpoint_ns=checkpoint_ns
+            ).order_by("-checkpoint_id").limit(keep)
+
+        if keep > 0 and len(kept) == keep:
+            oldest = kept[-1].checkpoint_id
+            # Channel versions only grow, so blobs older than every kept checkpoint's version are unreferenced
+            lowest: Dict[str, str] = {}
+            for record in kept:
+                versions = self.serde.loads_typed((record.type, record.checkpoint)).get("channel_versions") or {}
+                for channel, version in versions.items():
+                    if channel not in lowest or str(version) < lowest[channel]:
+                        lowest[channel] = str(version)
+
+            async with in_transaction() as connection:
+                scope = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}
+                pruned = await CheckpointRecord.filter(checkpoint_id__lt=oldest, **scope).using_db(connection).delete()
+                await CheckpointWrite.filter(checkpoint_id__lt=oldest, **scope).using_db(connection).delete()
+                if lowest:
+                    stale = Q(*[Q(channel=channel, version__lt=version) for channel, version in lowest.items()], join_type="OR")
+                    await CheckpointBlob.filter(stale, **scope).using_db(connection).delete()
+            if pruned:
+                metrics.increment("checkpoint.pruned", pruned)
+                await self._measure_thread(thread_id)
+
+    async def _measure_thread(self, thread_id: str) -> None:
+        """Re-baseline the thread's size after a prune (writes only ever add to it)"""
+        size = 0
+        for model, columns in (
+            (CheckpointRecord, ("checkpoint", "metadata")), (CheckpointBlob, ("blob",)), (CheckpointWrite, ("blob",))
+        ):
+            for column in columns:
+                rows = await model.filter(thread_id=thread_id).annotate(size=Sum(Length(column))).values("size")
+                size += (rows[0]["size"] or 0) if rows else 0
+        await CheckpointThread.filter(thread_id=thread_id).update(size_bytes=size)
+
+    async def aenforce_retention(self) -> None:
+        """Delete idle threads, then least recently active threads while over the byte budget"""
+        await self._settle()
+
+        if self.retention.thread_ttl_seconds > 0:
+            cutoff = tortoise_timezone.now() - timedelta(seconds=self.retention.thread_ttl_seconds)
+            while True:
+                expired = await CheckpointThread.filter(updated_at__lt=cutoff).order_by(
+                    "updated_at"
+                ).limit(_EVICT_PAGE_SIZE).values_list("thread_id", flat=True)
+                if not expired:
+                    break
+                await self._delete_threads(expired)
+                metrics.increment("checkpoint.evicted.ttl", len(expired))
+
+        if self.retention.max_bytes > 0:
+            totals = await CheckpointThread.annotate(total=Sum("size_bytes")).values("total")
+            excess = (totals[0]["total"] or 0) - self.retention.max_bytes if totals else 0
+            while excess > 0:
+                oldest = await CheckpointThread.all().order_by("updated_at").limit(_EVICT_PAGE_SIZE).values_list(
+                    "thread_id", "size_bytes"
+                )
+                if not oldest:
+                    break
+                evict = []
+                for thread_id, size in oldest:
+                    if excess <= 0:
+                        break
+                    evict.append(thread_id)
+                    excess -= size
+                await self._delete_threads(evict)
+                metrics.increment("checkpoint.evicted.budget", len(evict))
+
+    async def ausage(self) -> Dict[str, Any]:
+        """Stored threads and their size"""
+        await self._settle()
+        totals = await CheckpointThread.annotate(threads=Count("id"), total=Sum("size_bytes")).values("threads", "total")
+        return {
+            "backend": "postgres",
+            "durability": self.durability,
+            "threads": totals[0]["threads"] if totals else 0,
+            "bytes": (totals[0]["total"] or 0) if totals else 0,
+            **self.retention.as_dict()
+        }
+
+    # Reads
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        await self._settle(thread_id)
+
+        query = CheckpointRecord.filter(thread_id=thread_id, checkpoint_ns=checkpoint_ns)
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id:
+            record = await query.filter(checkpoint_id=checkpoint_id).first()
+        else:
+            record = await query.order_by("-checkpoint_id").first()
+
+        return await self._load(record) if record else None
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        query = CheckpointRecord.all()
+        if config:
+            thread_id = config["configurable"]["thread_id"]
+            await self._settle(thread_id)
+            query = query.filter(thread_id=thread_id)
+            if config["configurable"].get("checkpoint_ns") is not None:
+                query = query.filter(checkpoint_ns=config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.filter(checkpoint_id=checkpoint_id)
+        else:
+            await self._settle()
+
+        cursor = get_checkpoint_id(before) if before else None
+        while limit is None or limit > 0:
+            # Newest first, a page at a time so long histories aren't loaded at once
+            page_query = query.filter(checkpoint_id__lt=cursor) if cursor else query
+            page = await page_query.order_by("-checkpoint_id").limit(_HISTORY_PAGE_SIZE)
+            for record in page:
+                metadata = self.serde.loads_typed((record.metadata_type, record.metadata))
+                if filter and not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                yield await self._load(record, metadata)
+                if limit is not None:
+                    limit -= 1
+                    if limit <= 0:
+                        return
+            if len(page) < _HISTORY_PAGE_SIZE:
+                return
+            cursor = page[-1].checkpoint_id
+
+    async def _load(self, record: CheckpointRecord, metadata: Optional[CheckpointMetadata] = None) -> CheckpointTuple:
+        checkpoint = self.serde.loads_typed((record.type, record.checkpoint))
+        if metadata is None:
+            metadata = self.serde.loads_typed((record.metadata_type, record.metadata))
+
+        channel_values = {}
+        versions = checkpoint.get("channel_versions") or {}
+        if versions:
+            wanted = Q(*[Q(channel=channel, version=str(version)) for channel, version in versions.items()], join_type="OR")
+            blobs = await CheckpointBlob.filter(wanted, thread_id=record.thread_id, checkpoint_ns=record.checkpoint_ns)
+            channel_values = {
+                blob.channel: self.serde.loads_typed((blob.type, blob.blob))
+                for blob in blobs if blob.type != "empty"
+            }
+
+        writes = await CheckpointWrite.filter(
+            thread_id=record.thread_id, checkpoint_ns=record.checkpoint_ns, checkpoint_id=record.checkpoint_id
+        ).order_by("task_id", "idx")
+
+        def config_for(checkpoint_id: str) -> RunnableConfig:
+            return {"configurable": {
+                "thread_id": record.thread_id, "checkpoint_ns": record.checkpoint_ns, "checkpoint_id": checkpoint_id
+            }}
+
+        return CheckpointTuple(
+            config=config_for(record.checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=metadata,
+            parent_config=config_for(record.parent_checkpoint_id) if record.parent_checkpoint_id else None,
+            pending_writes=[(w.task_id, w.channel, self.serde.loads_typed((w.type, w.blob))) for w in writes]
+        )
+
+    # Threads
+
+    async def alist_threads(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Most recently active threads first (served by the updated_at index)"""
+        await self._settle()
+        threads = await CheckpointThread.all().order_by("-updated_at").offset(offset).limit(limit)
+        return [
+            {"thread_id": t.thread_id, "created_at": t.created_at, "updated_at": t.updated_at}
+            for t in threads
+        ]
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self._settle(thread_id)
+        await self._delete_threads([thread_id])
+        metrics.increment("checkpoint.deleted_threads")
+
+    async def _delete_threads(self, thread_ids: List[str]) -> None:
+        async with in_transaction() as connection:
+            for model in (CheckpointWrite, CheckpointBlob, CheckpointRecord, CheckpointThread):
+                await model.filter(thread_id__in=thread_ids).using_db(connection).delete()
+
+
+class _ThreadUsage:
+    """Serialized sizes of one thread's checkpoints, blobs and writes"""
+
+    def __init__(self):
+        self.created_at = self.updated_at = datetime.now(timezone.utc)
+        self.last_used = time.monotonic()
+        self.bytes = 0
+        self.sizes: Dict[tuple, int] = {}  # ("checkpoint"|"writes", ns, id) or ("blob", ns, channel, version)
+        self.versions: Dict[tuple, Dict[str, Any]] = {}  # (ns, checkpoint_id) -> channel_versions
+
+
+class MemoryCheckpointer(_RetentionSweeper, InMemorySaver):
+    """InMemorySaver with per-thread size accounting and retention; lost on restart"""
+
+    def __init__(self, retention: Optional[CheckpointRetention] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.retention = retention or CheckpointRetention()
+        self.threads: "OrderedDict[str, _ThreadUsage]" = OrderedDict()  # Least recently used first
+        self.total_bytes = 0
+
+        metrics.register_gauge("checkpoint.memory_bytes", lambda: self.total_bytes)
+        metrics.register_gauge("checkpoint.memory_threads", lambda: len(self.threads))
+
+    def _use(self, thread_id: str, write: bool = False) -> _ThreadUsage:
+        usage = self.threads.get(thread_id)
+        if usage is None:
+            usage = self.threads[thread_id] = _ThreadUsage()
+        self.threads.move_to_end(thread_id)
+        usage.last_used = time.monotonic()
+        if write:
+            usage.updated_at = datetime.now(timezone.utc)
+        return usage
+
+    def _set_size(self, usage: _ThreadUsage, key: tuple, size: int):
+        delta = size - usage.sizes.get(key, 0)
+        usage.sizes[key] = size
+        usage.bytes += delta
+        self.total_bytes += delta
+
+    def _drop_size(self, usage: _ThreadUsage, key: tuple):
+        size = usage.sizes.pop(key, 0)
+        usage.bytes -= size
+        self.total_bytes -= size
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        result = super().get_tuple(config)
+        if thread_id in self.threads:
+            self._use(thread_id)
+        else:
+            self.storage.pop(thread_id, None)  # InMemorySaver's defaultdict adds an entry on lookup
+        return result
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint_id = checkpoint["id"]
+
+        usage = self._use(thread_id, write=True)
+        saved_checkpoint, saved_metadata, _ = self.storage[thread_id][checkpoint_ns][checkpoint_id]
+        self._set_size(usage, ("checkpoint", checkpoint_ns, checkpoint_id), len(saved_checkpoint[1]) + len(saved_metadata[1]))
+        usage.versions[(checkpoint_ns, checkpoint_id)] = dict(checkpoint["channel_versions"])
+        for channel, version in new_versions.items():
+            blob = self.blobs[(thread_id, checkpoint_ns, channel, version)]
+            self._set_size(usage, ("blob", checkpoint_ns, channel, version), len(blob[1]))
+
+        self._prune(thread_id, checkpoint_ns)
+        self._enforce(thread_id)
+        return next_config
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        super().put_writes(config, writes, task_id, task_path)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        stored = self.writes[(thread_id, checkpoint_ns, checkpoint_id)]
+        size = sum(len(value[1]) for _, _, value, _ in stored.values())
+        self._set_size(self._use(thread_id, write=True), ("writes", checkpoint_ns, checkpoint_id), size)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        """Drop checkpoints beyond the newest keep_last, with their writes and unreferenced blobs"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        keep = self.retention.keep_last
+        if keep <= 0 or len(checkpoints) <= keep:
+            return
+
+        usage = self.threads[thread_id]
+        stale = sorted(checkpoints)[:-keep]
+        candidates = set()
+        for checkpoint_id in stale:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._drop_size(usage, ("checkpoint", checkpoint_ns, checkpoint_id))
+            self._drop_size(usage, ("writes", checkpoint_ns, checkpoint_id))
+            candidates.update(usage.versions.pop((checkpoint_ns, checkpoint_id), {}).items())
+
+        referenced = {
+            item for (ns, _), versions in usage.versions.items() if ns == checkpoint_ns for item in versions.items()
+        }
+        for channel, version in candidates - referenced:
+            self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+            self._drop_size(usage, ("blob", checkpoint_ns, channel, version))
+        metrics.increment("checkpoint.pruned", len(stale))
+
+    def _enforce(self, current: Optional[str] = None):
+        """Evict idle threads, then least recently used ones while over the byte budget"""
+        now = time.monotonic()
+        while self.threads:
+            thread_id, usage = next(iter(self.threads.items()))
+            if thread_id == current:
+                break
+            if self.retention.thread_ttl_seconds > 0 and now - usage.last_used > self.retention.thread_ttl_seconds:
+                reason = "ttl"
+            elif self.retention.max_bytes > 0 and self.total_bytes > self.retention.max_bytes:
+                reason = "budget"
+            else:
+                break
+            self.delete_thread(thread_id)
+            metrics.increment(f"checkpoint.evicted.{reason}")
+
+    def delete_thread(self, thread_id: str) -> None:
+        usage = self.threads.pop(thread_id, None)
+        if usage is None:
+            super().delete_thread(thread_id)
+            return
+
+        # Only this thread's keys, instead of InMemorySaver's scan over every thread
+        self.storage.pop(thread_id, None)
+        for checkpoint_ns, checkpoint_id in usage.versions:
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        for key in usage.sizes:
+            if key[0] == "blob":
+                self.blobs.pop((thread_id,) + key[1:], None)
+            elif key[0] == "writes":
+                self.writes.pop((thread_id,) + key[1:], None)
+        self.total_bytes -= usage.bytes
+
+    async def aenforce_retention(self) -> None:
+        self._enforce()
+
+    async def ausage(self) -> Dict[str, Any]:
+        self._enforce()
+        return {
+            "backend": "memory",
+            "threads": len(self.threads),
+            "checkpoints": sum(len(usage.versions) for usage in self.threads.values()),
+            "bytes": self.total_bytes,
+            **self.retention.as_dict()
+        }
+
+    async def alist_threads(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        ordered = sorted(self.threads.items(), key=lambda item: item[1].updated_at, reverse=True)
+        return [
+            {"thread_id": thread_id, "created_at": usage.created_at, "updated_at": usage.updated_at}
+            for thread_id, usage in ordered[offset:offset + limit]
+        ]
+
+    async def aflush(self) -> None:
+        pass
+
+
+def create_checkpointer() -> BaseCheckpointSaver:
+    """Checkpointer selected by CHECKPOINT_BACKEND"""
+    if CHECKPOINT_BACKEND == "memory":
+        return MemoryCheckpointer()
+    return PostgresCheckpointer()
@@ -0,0 +1,67 @@
+"""
+Inverted index for course discovery
+Maps normalized tokens from category, difficulty and title to course ids so
+filtering a message only touches the courses it actually mentions.
+Built once per catalog version via course_catalog.derived().
+"""
+import os
+import re
+from typing import Dict, List, Any, Tuple
+
+
+COURSE_FILTER_LIMIT = int(os.getenv("COURSE_FILTER_LIMIT", "20"))
+
+# Match strength per field
+CATEGORY_WEIGHT = 3.0
+DIFFICULTY_WEIGHT = 2.0
+TITLE_WORD_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9+#]+")
+
+
+def normalize(token: str) -> str:
+    """Lowercase and fold simple plurals ("courses" -> "course")"""
+    token = token.lower()
+    if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [normalize(t) for t in _TOKEN_RE.findall(text.lower())]
+
+
+class CourseIndex:
+    """Token -> course postings for one catalog version"""
+
+    def __init__(self, courses: List[Dict[str, Any]]):
+        self.courses = courses
+        # token -> list of (course index, weight, phrase) where phrase must be fully present
+        self._postings: Dict[str, List[Tuple[int, float, Tuple[str, ...]]]] = {}
+
+        for index, course in enumerate(courses):
+            self._add_phrase(index, tokenize(course["category"]), CATEGORY_WEIGHT)
+            self._add_phrase(index, tokenize(course["difficulty"]), DIFFICULTY_WEIGHT)
+
+            # Title keywords longer than 3 characters, each counted once
+            for word in dict.fromkeys(w for w in tokenize(course["title"]) if len(w) > 3):
+                self._add_phrase(index, (word,), TITLE_WORD_WEIGHT)
+
+    def _add_phrase(self, index: int, tokens, weight: float):
+        phrase = tuple(tokens)
+        if phrase:
+            # Multi-word phrases are posted under their first token and verified at query time
+            self._postings.setdefault(phrase[0], []).append((index, weight, phrase))
+
+    def search(self, message: str, limit: int = COURSE_FILTER_LIMIT) -> List[Dict[str, Any]]:
+        """Courses matching the message, strongest match first (catalog order breaks ties)"""
+        tokens = set(tokenize(message))
+
+        scores: Dict[int, float] = {}
+        for token in tokens:
+            for index, weight, phrase in self._postings.get(token, ()):
+                if len(phrase) == 1 or all(t in tokens for t in phrase):
+                    scores[index] = scores.get(index, 0.0) + weight
+
+        ranked = sorted(scores, key=lambda index: (-scores[index], index))
+        return [self.courses[index] for index in ranked[:limit]]
@@ -0,0 +1,150 @@
+"""
+Precompiled enrollment matcher
+Finds the courses an enrollment message refers to in time proportional to the
+message length (plus the courses it actually mentions), not the catalog size.
+Built once per catalog version. Uses the rules of the original per-course scan, except that
+partial title matches must respect any specific word the user named.
+"""
+from typing import Dict, List, Set, Any
+
+from ai.automaton import AhoCorasick
+
+
+# Words ignored when matching title keywords
+STOPWORDS = {'to', 'the', 'and', 'with', 'for', 'from', 'a', 'an', 'in', 'of', 'on'}
+
+# Abbreviations only count as standalone words
+ABBREVIATIONS = {
+    "ai": ["artificial", "intelligence"],
+    "ml": ["machine", "learning"],
+    "k8s": ["kubernetes"],
+    "devops": ["devops"]
+}
+
+# If the user names one of these, a generic abbreviation match must also contain it
+SPECIFIC_WORDS = ["ethics", "basics", "introduction", "advanced", "deep", "neural"]
+
+
+class EnrollmentMatcher:
+    """Course lookup structures for one catalog version"""
+
+    def __init__(self, courses: List[Dict[str, Any]]):
+        self.courses = courses
+        self._entries = []
+
+        self._by_title: Dict[str, List[int]] = {}
+        self._by_word: Dict[str, Dict[int, int]] = {}  # title word -> course index -> occurrences
+        self._by_first_word_category: Dict[tuple, List[int]] = {}
+        self._by_category_difficulty: Dict[tuple, List[int]] = {}
+        self._by_abbreviation: Dict[str, Set[int]] = {abbr: set() for abbr in ABBREVIATIONS}
+
+        patterns = set(SPECIFIC_WORDS)
+        for index, course in enumerate(courses):
+            title = course["title"].lower()
+            category = course["category"].lower()
+            difficulty = course["difficulty"].lower()
+            title_words = [w for w in title.split() if w not in STOPWORDS]
+
+            self._entries.append({
+                "title_words": title_words,
+                "specific": {word for word in SPECIFIC_WORDS if word in title}
+            })
+
+            self._by_title.setdefault(title, []).append(index)
+            for word in title_words:
+                postings = self._by_word.setdefault(word, {})
+                postings[index] = postings.get(index, 0) + 1
+            if title_words:
+                self._by_first_word_category.setdefault((title_words[0], category), []).append(index)
+            self._by_category_difficulty.setdefault((category, difficulty), []).append(index)
+            for abbr, full_words in ABBREVIATIONS.items():
+                if all(word in title for word in full_words):
+                    self._by_abbreviation[abbr].add(index)
+
+            patterns.update([title, category, difficulty, *title_words])
+
+        self._automaton = AhoCorasick(patterns)
+        self._title_automaton = AhoCorasick(self._by_title.keys())
+
+    def match(self, message_lower: str) -> List[Dict[str, Any]]:
+        """Courses the message asks to enroll in, in catalog order"""
+        found = self._automaton.find(message_lower)  # every pattern that is a substring
+        message_words = message_lower.split()
+        word_positions: Dict[str, int] = {}
+        for position, word in enumerate(message_words):
+            word_positions.setdefault(word, position)
+
+        # Only courses with at least one possible rule hit are evaluated
+        candidates: Set[int] = set()
+        for title in found:
+            candidates.update(self._by_title.get(title, ()))
+        word_hits: Dict[int, int] = {}
+        for word in found:
+            for index, count in self._by_word.get(word, {}).items():
+                word_hits[index] = word_hits.get(index, 0) + count
+        candidates.update(index for index, count in word_hits.items() if count >= 2)
+        for key in self._pairs(found, self._by_first_word_category):
+            candidates.update(self._by_first_word_category[key])
+        category_difficulty_candidates = set()
+        for key in self._pairs(found, self._by_category_difficulty):
+            category_difficulty_candidates.update(self._by_category_difficulty[key])
+        candidates |= category_difficulty_candidates
+        abbreviations = [abbr for abbr in ABBREVIATIONS if abbr in word_positions]
+        for abbr in abbreviations:
+            candidates.update(self._by_abbreviation[abbr])
+
+        has_specific = any(word in found for word in SPECIFIC_WORDS)
+        title_mentioned = any(word in self._by_title for word in found)
+        matched: List[int] = []
+
+        for index in sorted(candidates):
+            course = self.courses[index]
+            entry = self._entries[index]
+            title_words = entry["title_words"]
+
+            # Full course title is mentioned (most specific match)
+            if course["title"].lower() in found:
+                matched.append(index)
+                continue
+
+            # Partial title matches need one of the specific words the user named
+            # (e.g. "advanced machine learning" must not also pick up "Machine Learning Basics")
+            specific_ok = not has_specific or any(word in found for word in entry["specific"])
+
+            # Abbreviation used as a standalone word
+            if specific_ok and any(index in self._by_abbreviation[abbr] for abbr in abbreviations):
+                matched.append(index)
+                continue
+
+            # Enough title keywords, close together in the message
+            if specific_ok and len(title_words) >= 2:
+                matched_words = [word for word in title_words if word in found]
+                min_matches = 3 if len(title_words) >= 4 else 2
+                if len(matched_words) >= min_matches:
+                    positions = [word_positions[w] for w in matched_words[:min_matches] if w in word_positions]
+                    if len(positions) >= min_matches and max(positions) - min(positions) <= 5:
+                        matched.append(index)
+                        continue
+
+            # First title keyword plus category (e.g. "introduction ai"), unless a full title was named
+            if (specific_ok and not title_mentioned and title_words and title_words[0] in found
+                    and course["category"].lower() in found):
+                matched.append(index)
+                continue
+
+            # Category plus difficulty, only while nothing else has matched
+            if not matched and index in category_difficulty_candidates:
+                matched.append(index)
+
+        return [self.courses[index] for index in matched]
+
+    def mentioned_in(self, text_lower: str) -> List[Dict[str, Any]]:
+        """Courses whose full title appears in text, in catalog order"""
+        found = self._title_automaton.find(text_lower)
+        indexes = sorted(index for title in found for index in self._by_title[title])
+        return [self.courses[index] for index in indexes]
+
+    @staticmethod
+    def _pairs(found: Set[str], index: Dict[tuple, List[int]]):
+        """Keys of a two-word index whose both parts were found"""
+        return [key for key in ((a, b) for a in found for b in found) if key in index]
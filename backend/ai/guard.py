@@ -0,0 +1,108 @@
+"""
+External-platform response guard
+Blocked terms are compiled into a single Aho-Corasick automaton, so checking a
+response is one pass over its characters however long the term list gets.
+Streams are checked chunk by chunk without rescanning.
+
+Terms come from BLOCKED_TERMS_FILE (one per line, # for comments) when set and
+are reloaded when the file changes; otherwise DEFAULT_BLOCKED_TERMS is used.
+"""
+import os
+import time
+from typing import List, Optional
+
+from ai import metrics
+from ai.automaton import AhoCorasick
+
+
+# External platforms that must never appear in a response
+DEFAULT_BLOCKED_TERMS = [
+    "coursera", "edx", "udemy", "udacity", "pluralsight",
+    "linkedin learning", "fast.ai", "fast ai", "datacamp",
+    "andrew ng", "ibm", "google", "microsoft", "amazon",
+    "khan academy", "skillshare", "treehouse"
+]
+
+BLOCKED_TERMS_FILE = os.getenv("BLOCKED_TERMS_FILE")
+GUARD_RELOAD_SECONDS = float(os.getenv("GUARD_RELOAD_SECONDS", "5"))
+
+
+class ResponseGuard:
+    """Compiled blocked-term matcher (case-insensitive substring match)"""
+
+    def __init__(self, terms: List[str]):
+        self.terms = sorted({term.strip().lower() for term in terms if term.strip()})
+        self._automaton = AhoCorasick(self.terms)
+
+    def contains(self, text: str) -> bool:
+        """Whether text mentions any blocked term"""
+        return self._automaton.scan(text.lower())[1]
+
+    def scanner(self) -> "StreamScanner":
+        """Incremental checker for a response that arrives in chunks"""
+        return StreamScanner(self)
+
+
+class StreamScanner:
+    """Carries the automaton state from one chunk to the next"""
+
+    def __init__(self, guard: ResponseGuard):
+        self._automaton = guard._automaton
+        self._state = 0
+
+    def feed(self, chunk: str) -> bool:
+        """Scan the next chunk; True once a blocked term has been seen"""
+        self._state, hit = self._automaton.scan(chunk.lower(), self._state)
+        return hit
+
+    @property
+    def pending(self) -> int:
+        """Trailing characters that could still turn out to be part of a blocked term"""
+        return self._automaton.depth(self._state)
+
+
+_guard = ResponseGuard(DEFAULT_BLOCKED_TERMS)
+_loaded_mtime: Optional[float] = None
+_next_check = 0.0
+
+
+def _read_terms(path: str) -> List[str]:
+    with open(path) as f:
+        return [line.split("#", 1)[0] for line in f]
+
+
+def get_guard() -> ResponseGuard:
+    """Current guard, reloading BLOCKED_TERMS_FILE if it changed (checked every GUARD_RELOAD_SECONDS)"""
+    global _guard, _loaded_mtime, _next_check
+
+    if not BLOCKED_TERMS_FILE:
+        return _guard
+
+    now = time.monotonic()
+    if now < _next_check:
+        return _guard
+    _next_check = now + GUARD_RELOAD_SECONDS
+
+    try:
+        mtime = os.path.getmtime(BLOCKED_TERMS_FILE)
+        if mtime != _loaded_mtime:
+            _guard = ResponseGuard(_read_terms(BLOCKED_TERMS_FILE))
+            _loaded_mtime = mtime
+            metrics.increment("guard.reloads")
+            print(f"✓ Loaded {len(_guard.terms)} blocked terms from {BLOCKED_TERMS_FILE}")
+    except Exception as e:
+        # Keep the last good term list
+        print(f"⚠️ Could not load blocked terms from {BLOCKED_TERMS_FILE}: {e}")
+
+    return _guard
+
+
+def set_blocked_terms(terms: List[str]) -> ResponseGuard:
+    """Replace the blocked-term list at runtime"""
+    global _guard
+    _guard = ResponseGuard(terms)
+    metrics.increment("guard.reloads")
+    return _guard
+
+
+metrics.register_gauge("guard.blocked_terms", lambda: len(_guard.terms))
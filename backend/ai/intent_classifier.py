@@ -0,0 +1,137 @@
+"""
+Local intent classifier for routing
+Hashed word/char n-gram features with a nearest-centroid model (NumPy only).
+Trained offline with train_intent_classifier.py, loaded once at startup.
+"""
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+# Same intents as RouteDecision.intent
+INTENTS = ["course_discovery", "enrollment", "recommendation", "general_qa", "complex_query"]
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "intent_model.npz")
+
+_TOKEN_RE = re.compile(r"[a-z0-9+#]+")
+
+
+def _hash(feature: str, dim: int) -> int:
+    """Stable feature hash (Python's hash() is randomized per process)"""
+    return zlib.crc32(feature.encode("utf-8")) % dim
+
+
+def extract_features(text: str, dim: int) -> Dict[int, float]:
+    """Hashed word unigrams, word bigrams and char trigrams, L2-normalized"""
+    tokens = _TOKEN_RE.findall(text.lower())
+
+    features = [f"w:{t}" for t in tokens]
+    features += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"^{token}$"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+
+    counts: Dict[int, float] = {}
+    for feature in features:
+        index = _hash(feature, dim)
+        counts[index] = counts.get(index, 0.0) + 1.0
+
+    norm = sum(v * v for v in counts.values()) ** 0.5
+    if norm:
+        counts = {i: v / norm for i, v in counts.items()}
+    return counts
+
+
+def _sparse_batch(messages: List[str], dim: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Batch features as COO arrays (rows, cols, values)"""
+    rows, cols, vals = [], [], []
+    for row, message in enumerate(messages):
+        for col, val in extract_features(message, dim).items():
+            rows.append(row)
+            cols.append(col)
+            vals.append(val)
+    return (
+        np.asarray(rows, dtype=np.int64),
+        np.asarray(cols, dtype=np.int64),
+        np.asarray(vals, dtype=np.float32)
+    )
+
+
+class IntentClassifier:
+    """Nearest-centroid intent model over hashed n-gram features"""
+
+    def __init__(self, intents: List[str], centroids: np.ndarray, scale: float = 10.0):
+        self.intents = list(intents)
+        self.centroids = centroids.astype(np.float32)  # (n_intents, dim), rows L2-normalized
+        self.dim = centroids.shape[1]
+        self.scale = scale  # Softmax sharpness applied to cosine similarities
+
+    @classmethod
+    def fit(cls, messages: List[str], labels: List[str], dim: int = 2 ** 14, scale: float = 10.0) -> "IntentClassifier":
+        """Train centroids from labeled messages"""
+        intents = [intent for intent in INTENTS if intent in set(labels)]
+        if not intents:
+            raise ValueError("No labeled examples for any known intent")
+
+        label_index = {intent: i for i, intent in enumerate(intents)}
+        centroids = np.zeros((len(intents), dim), dtype=np.float32)
+
+        rows, cols, vals = _sparse_batch(messages, dim)
+        targets = np.asarray([label_index.get(label, -1) for label in labels], dtype=np.int64)
+        known = targets[rows] >= 0
+        np.add.at(centroids, (targets[rows][known], cols[known]), vals[known])
+
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms == 0, 1.0, norms)
+        return cls(intents, centroids, scale)
+
+    def predict(self, messages: List[str]) -> List[Tuple[str, float]]:
+        """Predict (intent, confidence) for a batch of messages"""
+        if not messages:
+            return []
+
+        rows, cols, vals = _sparse_batch(messages, self.dim)
+
+        # Cosine similarity to each centroid, accumulated from the sparse features
+        scores = np.zeros((len(messages), len(self.intents)), dtype=np.float32)
+        np.add.at(scores, rows, (self.centroids[:, cols] * vals).T)
+
+        logits = self.scale * scores
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        best = probs.argmax(axis=1)
+        return [(self.intents[i], float(probs[row, i])) for row, i in enumerate(best)]
+
+    def save(self, path: str) -> None:
+        """Write the model artifact"""
+        np.savez_compressed(
+            path,
+            intents=np.asarray(self.intents),
+            centroids=self.centroids,
+            scale=np.asarray(self.scale)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        """Read a model artifact written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls([str(i) for i in data["intents"]], data["centroids"], float(data["scale"]))
+
+
+def load_intent_classifier(path: Optional[str] = None) -> Optional[IntentClassifier]:
+    """Load the classifier from INTENT_MODEL_PATH, or None if no artifact is available"""
+    path = path or os.getenv("INTENT_MODEL_PATH", DEFAULT_MODEL_PATH)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        classifier = IntentClassifier.load(path)
+        print(f"✓ Loaded intent classifier from {path} ({len(classifier.intents)} intents)")
+        return classifier
+    except Exception as e:
+        print(f"⚠️ Could not load intent classifier from {path}: {e}")
+        return None
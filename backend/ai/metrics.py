@@ -0,0 +1,46 @@
+"""
+Process-wide agent metrics
+Simple in-memory counters and gauges, exposed via /api/agent/metrics
+"""
+from collections import defaultdict
+from typing import Callable, Dict, Any
+
+
+_counters: Dict[str, int] = defaultdict(int)
+_gauges: Dict[str, Callable[[], Any]] = {}
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """Increment a named counter"""
+    _counters[name] += amount
+
+
+def get_counter(name: str) -> int:
+    """Current value of a counter (0 if never incremented)"""
+    return _counters.get(name, 0)
+
+
+def register_gauge(name: str, func: Callable[[], Any]) -> None:
+    """Register a callable evaluated on every snapshot (e.g. rates, queue depths)"""
+    _gauges[name] = func
+
+
+def ratio(numerator: str, denominator: str) -> float:
+    """Ratio between two counters, 0.0 when the denominator is empty"""
+    total = get_counter(denominator)
+    return get_counter(numerator) / total if total else 0.0
+
+
+def snapshot() -> Dict[str, Any]:
+    """Current values of all counters and gauges"""
+    gauges = {}
+    for name, func in _gauges.items():
+        try:
+            gauges[name] = func()
+        except Exception as e:
+            gauges[name] = f"error: {e}"
+
+    return {
+        "counters": dict(sorted(_counters.items())),
+        "gauges": dict(sorted(gauges.items()))
+    }
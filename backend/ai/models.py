@@ -1,47 +1,219 @@
 import os
+import asyncio
+from typing import AsyncIterator, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import httpx
+from botocore.config import Config as BotoConfig
 import google.generativeai as genai
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_aws import ChatBedrock
 from langchain_mistralai import ChatMistralAI
+from ai.resilience import get_breaker, is_transient
+
+
+# Bounded pool for provider clients without a native async API (e.g. ChatBedrock),
+# so blocking SDK calls never run on the event loop
+_llm_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_THREAD_POOL_SIZE", "16")),
+    thread_name_prefix="llm-call"
+)
+
+# Connection pool settings shared by all provider clients
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))  # Max open connections per provider
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))  # Idle connection lifetime
+LLM_TIMEOUT_SECONDS = int(os.getenv("LLM_TIMEOUT_SECONDS", "120"))  # Per-request timeout
+
+GEMINI_MODEL_MAP = {
+    "gemini-2.5-pro": "gemini-2.0-flash-exp",
+    "gemini-2.5-flash": "gemini-2.0-flash-exp",
+    "gemini-2.5-flash-lite": "gemini-2.0-flash-exp"
+}
+
+BEDROCK_MODEL_MAP = {
+    "bedrock-nova": "amazon.nova-pro-v1:0",
+    "bedrock-sonnet": "anthropic.claude-3-5-sonnet-20241022-v2:0"
+}
+
+# Provider clients, created once per process and reused by every node
+_clients: Dict[str, Any] = {}
+_gemini_configured = False
+_bedrock_runtime = None
 
 
 def get_model(model_name: str):
-    """Get the appropriate LLM model based on name"""
+    """Get the appropriate LLM model based on name (one shared client per model)"""
+    
+    # Unknown names all share the default client, so the registry stays bounded
+    key = model_name if (model_name in GEMINI_MODEL_MAP or model_name in BEDROCK_MODEL_MAP or model_name == "mistral") else "default"
+    
+    client = _clients.get(key)
+    if client is None:
+        # Client setup talks to the provider too (credentials, endpoints), so it shares the call breaker
+        breaker = get_breaker(key)
+        breaker.check()
+        try:
+            client = _create_model(key)
+        except Exception as e:
+            if is_transient(e):
+                breaker.record_failure()
+            raise
+        _clients[key] = client
+    return client
+
+
+def _create_model(model_name: str):
+    """Create a provider client for a model"""
     
-    if model_name.startswith("gemini"):
+    if model_name in GEMINI_MODEL_MAP:
         # Use direct Google Generative AI SDK
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        
-        model_map = {
-            "gemini-2.5-pro": "gemini-2.0-flash-exp",
-            "gemini-2.5-flash": "gemini-2.0-flash-exp",
-            "gemini-2.5-flash-lite": "gemini-2.0-flash-exp"
-        }
-        
-        model_id = model_map.get(model_name, "gemini-2.0-flash-exp")
-        return genai.GenerativeModel(model_id)
-    
-    elif model_name == "bedrock-nova":
-        return ChatBedrock(
-            model_id="amazon.nova-pro-v1:0",
-            region_name=os.getenv("AWS_REGION", "us-east-1"),
-            credentials_profile_name=None
-        )
+        _configure_gemini()
+        return genai.GenerativeModel(GEMINI_MODEL_MAP[model_name])
     
-    elif model_name == "bedrock-sonnet":
+    elif model_name in BEDROCK_MODEL_MAP:
         return ChatBedrock(
-            model_id="anthropic.claude-3-5-sonnet-20241022-v2:0",
+            model_id=BEDROCK_MODEL_MAP[model_name],
             region_name=os.getenv("AWS_REGION", "us-east-1"),
-            credentials_profile_name=None
+            client=_get_bedrock_runtime()
         )
     
     elif model_name == "mistral":
+        sync_client, async_client = _create_mistral_http_clients()
         return ChatMistralAI(
             model="mistral-large-latest",
             mistral_api_key=os.getenv("MISTRAL_API_KEY"),
-            temperature=0.7
+            temperature=0.7,
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_concurrent_requests=LLM_POOL_SIZE,
+            client=sync_client,
+            async_client=async_client
         )
     
     else:
         # Default to Gemini
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _configure_gemini()
         return genai.GenerativeModel("gemini-2.0-flash-exp")
+
+
+def _configure_gemini():
+    """Configure the Gemini SDK once; reconfiguring drops its cached transport clients"""
+    global _gemini_configured
+    if _gemini_configured:
+        return
+    
+    options = {"api_key": os.getenv("GEMINI_API_KEY")}
+    if os.getenv("GEMINI_TRANSPORT"):
+        # "grpc" (default) or "rest"
+        options["transport"] = os.getenv("GEMINI_TRANSPORT")
+    genai.configure(**options)
+    _gemini_configured = True
+
+
+def _get_bedrock_runtime():
+    """Shared bedrock-runtime client with a pooled, keep-alive connection config"""
+    global _bedrock_runtime
+    if _bedrock_runtime is None:
+        session = boto3.session.Session()
+        _bedrock_runtime = session.client(
+            "bedrock-runtime",
+            region_name=os.getenv("AWS_REGION", "us-east-1"),
+            config=BotoConfig(
+                max_pool_connections=LLM_POOL_SIZE,
+                tcp_keepalive=True,
+                read_timeout=LLM_TIMEOUT_SECONDS
+            )
+        )
+    return _bedrock_runtime
+
+
+def _create_mistral_http_clients():
+    """HTTP clients for Mistral with pooled keep-alive connections"""
+    base_url = os.getenv("MISTRAL_BASE_URL", "https://api.mistral.ai/v1")
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "Authorization": f"Bearer {os.getenv('MISTRAL_API_KEY')}"
+    }
+    limits = httpx.Limits(
+        max_connections=LLM_POOL_SIZE,
+        max_keepalive_connections=LLM_POOL_SIZE,
+        keepalive_expiry=LLM_KEEPALIVE_SECONDS
+    )
+    sync_client = httpx.Client(base_url=base_url, headers=headers, timeout=LLM_TIMEOUT_SECONDS, limits=limits)
+    async_client = httpx.AsyncClient(base_url=base_url, headers=headers, timeout=LLM_TIMEOUT_SECONDS, limits=limits)
+    return sync_client, async_client
+
+
+def _has_native_async(llm) -> bool:
+    """Whether a LangChain chat model overrides the executor-based async default"""
+    return isinstance(llm, BaseChatModel) and type(llm)._agenerate is not BaseChatModel._agenerate
+
+
+async def run_in_llm_pool(func, *args):
+    """Run a blocking provider call on the bounded LLM thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_llm_executor, func, *args)
+
+
+async def generate_text(llm, model_name: str, prompt: str) -> str:
+    """Generate a completion without blocking the event loop"""
+    
+    if model_name.startswith("gemini") or isinstance(llm, genai.GenerativeModel):
+        # Native async Gemini call
+        response = await llm.generate_content_async(prompt)
+        return response.text
+    
+    if _has_native_async(llm):
+        # Native async LangChain client (e.g. ChatMistralAI over httpx)
+        response = await llm.ainvoke(prompt)
+    else:
+        # Sync-only client: run on the bounded pool
+        response = await run_in_llm_pool(llm.invoke, prompt)
+    
+    return response.content if hasattr(response, 'content') else str(response)
+
+
+def _chunk_text(chunk) -> str:
+    """Extract plain text from a LangChain message chunk"""
+    content = chunk.content if hasattr(chunk, 'content') else chunk
+    if isinstance(content, list):
+        # Some providers return content blocks instead of a plain string
+        return "".join(
+            block.get("text", "") if isinstance(block, dict) else str(block)
+            for block in content
+        )
+    return content or ""
+
+
+async def stream_text(llm, model_name: str, prompt: str) -> AsyncIterator[str]:
+    """Stream a completion as text chunks without blocking the event loop"""
+    
+    if model_name.startswith("gemini") or isinstance(llm, genai.GenerativeModel):
+        response = await llm.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk without text parts (e.g. finish or safety metadata)
+                continue
+            if text:
+                yield text
+        return
+    
+    if _has_native_async(llm):
+        async for chunk in llm.astream(prompt):
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+        return
+    
+    # Sync-only client: pull each chunk from the sync iterator on the bounded pool
+    iterator = iter(llm.stream(prompt))
+    done = object()
+    while True:
+        chunk = await run_in_llm_pool(next, iterator, done)
+        if chunk is done:
+            break
+        text = _chunk_text(chunk)
+        if text:
+            yield text
@@ -10,6 +10,8 @@ import asyncio
 from pydantic import BaseModel, Field
 from typing import Literal
 
+from ai.catalog import course_catalog
+
 
 # These will be methods added to LMSAgent class
 # Keeping them here for organization
@@ -237,7 +239,7 @@ async def worker_node(self, state: Dict[str, Any], model_name: str) -> Dict[str,
     """Phase 3: Execute subtasks in parallel"""
     
     subtasks = state.get("subtasks", [])
-    courses = state.get("courses", [])
+    courses = await course_catalog.get_courses()
     message = state["message"]
     
     if not subtasks:
@@ -293,7 +295,7 @@ Provide a comprehensive, well-structured response."""
     }
 
 
-def check_approval_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+async def check_approval_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
     """Phase 3: Check if action requires human approval"""
     
     requires_approval = state.get("requires_approval", False)
@@ -303,7 +305,7 @@ def check_approval_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
     # For now, auto-approve single enrollments, require approval for bulk
     if "enroll" in message.lower():
         # Count how many courses mentioned
-        courses = state.get("courses", [])
+        courses = await course_catalog.get_courses()
         mentioned_courses = sum(1 for course in courses if course["title"].lower() in message.lower())
         
         if mentioned_courses > 3:
@@ -0,0 +1,298 @@
+"""
+Provider resilience helpers for LLM calls
+- LatencyTracker: rolling per-model latency window, used to decide when to hedge
+- CircuitBreaker: per provider/model, rejects calls fast while a provider is failing
+- ProviderLimiter: per provider/model concurrency cap plus requests/tokens per minute
+- call_with_breaker: limiter, breaker check and jittered-backoff retries for transient errors
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from ai import metrics
+
+
+LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.2"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "2.0"))
+
+# Per-provider limits fall back to these (0 = unlimited); override with e.g. BEDROCK_RPM
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+
+# Provider errors worth retrying (matched by class name so no SDK imports are needed)
+TRANSIENT_ERRORS = {
+    "TimeoutError", "ConnectionError", "ConnectError", "ConnectTimeout", "ReadTimeout",
+    "RemoteProtocolError", "PoolTimeout",  # httpx (Mistral)
+    "ServiceUnavailable", "ResourceExhausted", "DeadlineExceeded", "InternalServerError",
+    "TooManyRequests",  # google.api_core (Gemini)
+    "EndpointConnectionError", "ReadTimeoutError", "ConnectTimeoutError"  # botocore (Bedrock)
+}
+TRANSIENT_BEDROCK_CODES = {
+    "ThrottlingException", "ServiceUnavailableException", "ModelTimeoutException",
+    "InternalServerException", "ModelNotReadyException"
+}
+
+
+class LatencyTracker:
+    """Last N successful call latencies per model"""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples  # Percentiles below this many samples are not trusted
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        """q-th percentile latency in seconds, or None while there are too few samples"""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def snapshot(self, q: float = 95) -> Dict[str, Optional[float]]:
+        return {model: self.percentile(model, q) for model in self._samples}
+
+
+class RequestBudgetExceeded(Exception):
+    """Raised when a request's latency budget runs out before or during an LLM call (never retried)"""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; after reset_seconds lets one probe call through"""
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"  # closed, open or half_open
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now"""
+        if self.state == "closed":
+            return
+        now = time.monotonic()
+        if now - self._opened_at >= self.reset_seconds:
+            # Let a single probe call test the provider (another one if the last probe never reported back)
+            self.state = "half_open"
+            self._opened_at = now
+            return
+        metrics.increment("circuit.rejected")
+        raise CircuitOpenError(f"Circuit open for {self.name}, retry in a few seconds")
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"⚠️ Circuit opened for {self.name} after {self.failures} failure(s)")
+                metrics.increment("circuit.opened")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """Refills per_minute units evenly over a minute; may go negative when usage is charged afterwards"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float) -> None:
+        amount = min(amount, self.capacity)  # A single huge request must still fit eventually
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def charge(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+
+class ProviderLimiter:
+    """Concurrency semaphore plus request and token buckets for one provider/model"""
+
+    def __init__(self, name: str, concurrency: int, rpm: int, tpm: int):
+        self.name = name
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.waiting = 0  # Calls queued for a slot or for budget
+        self.active = 0
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        """Wait for rate budget and a concurrency slot, hold the slot for the call"""
+        self.waiting += 1
+        try:
+            if self._requests:
+                await self._requests.acquire(1)
+            if self._tokens and tokens:
+                await self._tokens.acquire(tokens)
+            if self._semaphore:
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield self
+        finally:
+            self.active -= 1
+            if self._semaphore:
+                self._semaphore.release()
+
+    def charge_tokens(self, tokens: int) -> None:
+        """Count tokens only known after the call (the response)"""
+        if self._tokens and tokens:
+            self._tokens.charge(tokens)
+
+
+def estimate_tokens(text: Any) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return len(text) // 4 if isinstance(text, str) else 0
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def provider_of(model: str) -> str:
+    if model.startswith("gemini"):
+        return "gemini"
+    if model.startswith("bedrock"):
+        return "bedrock"
+    return model
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """Circuit breaker for a provider/model pair"""
+    name = f"{provider_of(model)}:{model}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def _provider_limit(provider: str, setting: str, default: int) -> int:
+    return int(os.getenv(f"{provider.upper()}_{setting}", default))
+
+
+def get_limiter(model: str) -> ProviderLimiter:
+    """Shared limiter for a provider/model pair"""
+    provider = provider_of(model)
+    name = f"{provider}:{model}"
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = ProviderLimiter(
+            name,
+            _provider_limit(provider, "MAX_CONCURRENCY", LLM_MAX_CONCURRENCY),
+            _provider_limit(provider, "RPM", LLM_RPM),
+            _provider_limit(provider, "TPM", LLM_TPM)
+        )
+    return limiter
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a provider error is likely to succeed on retry"""
+    if isinstance(error, RequestBudgetExceeded):
+        # Our own budget ran out; retrying can only make the request later
+        return False
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__):
+        return True
+
+    # botocore ClientError carries the service error code in .response
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in TRANSIENT_BEDROCK_CODES
+
+    # HTTP status on the error or its response (httpx, SDK wrappers)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def call_with_breaker(model: str, func: Callable[[], Awaitable[Any]], retries: int = LLM_MAX_RETRIES,
+                            prompt: str = "") -> Any:
+    """
+    Call a provider through its limiter and circuit breaker, retrying transient errors with backoff.
+    Only a call that still fails transiently after its retries counts against the breaker;
+    request-specific errors (blocked prompts, 4xx, validation) are re-raised without touching it.
+    """
+    breaker = get_breaker(model)
+    limiter = get_limiter(model)
+
+    for attempt in range(retries + 1):
+        breaker.check()
+        try:
+            async with limiter.slot(estimate_tokens(prompt)):
+                if breaker.state == "open":
+                    # The circuit opened while we were queued
+                    breaker.check()
+                result = await func()
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            if attempt == retries:
+                breaker.record_failure()
+                raise
+            metrics.increment("llm.retries")
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        breaker.record_success()
+        limiter.charge_tokens(estimate_tokens(result))
+        return result
+
+
+# Shared by all agent instances in this process
+llm_latency = LatencyTracker()
+
+metrics.register_gauge("llm.p95_seconds", llm_latency.snapshot)
+metrics.register_gauge("llm.queue_depth", lambda: {name: l.waiting for name, l in _limiters.items()})
+metrics.register_gauge("llm.active_calls", lambda: {name: l.active for name, l in _limiters.items()})
+metrics.register_gauge("circuit.open", lambda: sorted(name for name, b in _breakers.items() if b.state != "closed"))
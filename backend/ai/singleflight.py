@@ -0,0 +1,50 @@
+"""
+Single-flight call coalescing
+Concurrent callers asking for the same key share one in-flight call and all
+receive its result (or its exception). The shared call is only cancelled when
+every caller waiting on it has been cancelled.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from ai import metrics
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key"""
+
+    def __init__(self, name: str):
+        self.name = name  # Prefix for this group's metrics
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+        metrics.register_gauge(f"{name}.in_flight", lambda: len(self._calls))
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run func() once per key at a time; returns (result, whether this caller ran it)"""
+        task = self._calls.get(key)
+        leader = task is None
+
+        if leader:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            metrics.increment(f"{self.name}.coalesced_waiters")
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # Shielded so one cancelled caller doesn't cancel the call for the others
+            return await asyncio.shield(task), leader
+        except asyncio.CancelledError:
+            if self._waiters.get(key) == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
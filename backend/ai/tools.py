@@ -1,25 +1,14 @@
 from models import Course, Student, Enrollment
 from typing import Optional, List, Dict
+from ai.catalog import course_catalog
 
 
 async def get_courses_tool(category: Optional[str] = None) -> List[Dict]:
-    """Get all courses or filter by category"""
-    query = Course.all()
+    """Get all courses or filter by category (served from the catalog cache)"""
+    courses = await course_catalog.get_courses()
     if category:
-        query = query.filter(category=category)
-    
-    courses = await query
-    return [
-        {
-            "id": c.id,
-            "title": c.title,
-            "description": c.description,
-            "category": c.category,
-            "difficulty": c.difficulty,
-            "duration_hours": c.duration_hours
-        }
-        for c in courses
-    ]
+        courses = [c for c in courses if c["category"] == category]
+    return courses
 
 
 async def search_courses_tool(query: str) -> List[Dict]:
@@ -1,35 +1,36 @@
 """
 API endpoints for agent visualization and streaming
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
-from ai.agent import LMSAgent
+from ai.agent import lms_agent as agent, CONVERSATION_ID_PATTERN
+from ai import metrics
+from api.sse import cancel_on_disconnect
 import json
 
 router = APIRouter()
 
-# Initialize agent
-agent = LMSAgent()
-
 
 class ChatRequest(BaseModel):
     message: str
     model: str = "gemini-2.5-flash-lite"
     student_id: Optional[int] = None
+    conversation_id: Optional[str] = Field(None, pattern=CONVERSATION_ID_PATTERN)  # Omit to start a new conversation
 
 
 @router.post("/stream")
-async def chat_stream(request: ChatRequest):
-    """Stream agent processing updates"""
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Stream agent processing updates (the run is cancelled if the client disconnects)"""
     
     async def generate():
         try:
             async for update in agent.process_message_stream(
                 message=request.message,
                 model=request.model,
-                student_id=request.student_id
+                student_id=request.student_id,
+                conversation_id=request.conversation_id
             ):
                 # Send as Server-Sent Events format
                 yield f"data: {json.dumps(update)}\n\n"
@@ -42,7 +43,7 @@ async def chat_stream(request: ChatRequest):
             yield f"data: {json.dumps(error_data)}\n\n"
     
     return StreamingResponse(
-        generate(),
+        cancel_on_disconnect(http_request, generate()),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -78,6 +79,12 @@ async def get_mermaid_diagram(model: str = "gemini-2.5-flash-lite"):
 
 
 
+@router.get("/metrics")
+async def get_agent_metrics():
+    """Get agent runtime counters and gauges (router fast-path rate, caches, ...)"""
+    return metrics.snapshot()
+
+
 class ApprovalRequest(BaseModel):
     session_id: str
     approved: bool
@@ -1,17 +1,17 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
-from ai.agent import LMSAgent
+from ai.agent import lms_agent, CONVERSATION_ID_PATTERN
 from models import ChatHistory, Student
 
 router = APIRouter()
-lms_agent = LMSAgent()
 
 
 class ChatRequest(BaseModel):
     message: str
     student_id: Optional[int] = None
     model: str = "gemini-2.5-flash-lite"
+    conversation_id: Optional[str] = Field(None, pattern=CONVERSATION_ID_PATTERN)  # Omit to start a new conversation
 
 
 class ChatResponse(BaseModel):
@@ -19,6 +19,8 @@ class ChatResponse(BaseModel):
     model_used: str
     suggestions: Optional[list] = None
     enrolled: bool = False
+    skipped_stages: list[str] = []  # Stages skipped to stay within the latency budget
+    conversation_id: str  # Send back to continue this conversation
 
 
 @router.post("/", response_model=ChatResponse)
@@ -27,7 +29,8 @@ async def chat(request: ChatRequest):
         response = await lms_agent.process_message(
             message=request.message,
             model=request.model,
-            student_id=request.student_id
+            student_id=request.student_id,
+            conversation_id=request.conversation_id
         )
         
         if request.student_id:
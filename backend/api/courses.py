@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from typing import List, Optional
 from models import Course, Course_Pydantic, CourseIn_Pydantic
+from ai.catalog import course_catalog
 
 router = APIRouter()
 
@@ -11,35 +12,43 @@ async def get_courses(
     difficulty: Optional[str] = None,
     search: Optional[str] = None
 ):
-    query = Course.all()
+    # Served from the in-memory catalog; filters match the previous ORM query
+    courses = await course_catalog.get_records()
     
     if category:
-        query = query.filter(category=category)
+        courses = [c for c in courses if c.category == category]
     if difficulty:
-        query = query.filter(difficulty=difficulty)
+        courses = [c for c in courses if c.difficulty == difficulty]
     if search:
-        query = query.filter(title__icontains=search) | query.filter(description__icontains=search)
+        search_lower = search.lower()
+        courses = [
+            c for c in courses
+            if search_lower in c.title.lower() or search_lower in c.description.lower()
+        ]
     
-    courses = await query
-    return [Course_Pydantic.model_validate(course) for course in courses]
+    return courses
 
 
 @router.get("/{course_id}", response_model=Course_Pydantic)
 async def get_course(course_id: int):
-    course = await Course.get_or_none(id=course_id)
+    course = await course_catalog.get_record(course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    return Course_Pydantic.model_validate(course)
+    return course
 
 
 @router.post("/", response_model=Course_Pydantic)
 async def create_course(course: CourseIn_Pydantic):
     course_obj = await Course.create(**course.model_dump(exclude_unset=True))
+    
+    # New catalog version here and, via NOTIFY, in every other worker
+    await course_catalog.notify_change()
+    
     return Course_Pydantic.model_validate(course_obj)
 
 
 @router.get("/categories/list")
 async def get_categories():
-    courses = await Course.all()
+    courses = await course_catalog.get_records()
     categories = list(set([course.category for course in courses]))
     return {"categories": sorted(categories)}
@@ -0,0 +1,62 @@
+"""
+Server-Sent Events helpers shared by the streaming endpoints
+"""
+import asyncio
+import os
+from contextlib import suppress
+from typing import AsyncIterator
+
+from fastapi import Request
+
+from ai import metrics
+
+
+SSE_DISCONNECT_POLL_SECONDS = float(os.getenv("SSE_DISCONNECT_POLL_SECONDS", "0.5"))
+
+_DONE = object()
+
+
+async def cancel_on_disconnect(
+    request: Request,
+    events: AsyncIterator[str],
+    poll_interval: float = SSE_DISCONNECT_POLL_SECONDS
+) -> AsyncIterator[str]:
+    """Relay SSE events, cancelling the producer (graph run and its LLM calls) if the client goes away"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+
+    async def produce():
+        try:
+            async for event in events:
+                await queue.put(event)
+        finally:
+            with suppress(asyncio.QueueFull):
+                queue.put_nowait(_DONE)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({next_event}, timeout=poll_interval)
+
+            if not done:
+                next_event.cancel()
+                if producer.done() and queue.empty():
+                    break  # Finished without room for the end marker
+                if await request.is_disconnected():
+                    metrics.increment("stream.client_disconnects")
+                    return
+                continue
+
+            event = next_event.result()
+            if event is _DONE:
+                break
+            yield event
+
+        await producer  # Surface producer errors
+    finally:
+        # Also reached when the server cancels the response because the client disconnected
+        if not producer.done():
+            producer.cancel()
+            metrics.increment("stream.cancelled_runs")
+            with suppress(asyncio.CancelledError, Exception):
+                await producer
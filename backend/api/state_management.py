@@ -2,13 +2,12 @@
 Phase 4A: State Management APIs
 Expose LangGraph state management for debugging and control
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
-from ai.agent import LMSAgent
+from ai.agent import lms_agent as agent
 
 router = APIRouter()
-agent = LMSAgent()
 
 
 class StateRequest(BaseModel):
@@ -48,11 +47,11 @@ async def get_state(request: StateRequest):
         if request.checkpoint_id:
             config["configurable"]["checkpoint_id"] = request.checkpoint_id
         
-        # Build a temporary graph to access state
-        graph = agent._build_graph("gemini-2.5-flash-lite")
+        # Any compiled graph can read state from the shared checkpointer
+        graph = agent.get_graph("gemini-2.5-flash-lite")
         
         # Get state
-        state_snapshot = graph.get_state(config)
+        state_snapshot = await graph.aget_state(config)
         
         return {
             "success": True,
@@ -87,12 +86,12 @@ async def get_state_history(request: StateRequest):
             }
         }
         
-        # Build a temporary graph
-        graph = agent._build_graph("gemini-2.5-flash-lite")
+        # Any compiled graph can read state from the shared checkpointer
+        graph = agent.get_graph("gemini-2.5-flash-lite")
         
         # Get state history
         history = []
-        for state_snapshot in graph.get_state_history(config):
+        async for state_snapshot in graph.aget_state_history(config):
             history.append({
                 "checkpoint_id": state_snapshot.config.get("configurable", {}).get("checkpoint_id"),
                 "values": state_snapshot.values,
@@ -136,11 +135,11 @@ async def update_state(request: UpdateStateRequest):
             }
         }
         
-        # Build a temporary graph
-        graph = agent._build_graph("gemini-2.5-flash-lite")
+        # Any compiled graph can read state from the shared checkpointer
+        graph = agent.get_graph("gemini-2.5-flash-lite")
         
         # Update state
-        updated_config = graph.update_state(
+        updated_config = await graph.aupdate_state(
             config,
             request.values,
             as_node=request.as_node
@@ -177,11 +176,11 @@ async def replay_from_checkpoint(request: StateRequest):
             }
         }
         
-        # Build a temporary graph
-        graph = agent._build_graph("gemini-2.5-flash-lite")
+        # Any compiled graph can read state from the shared checkpointer
+        graph = agent.get_graph("gemini-2.5-flash-lite")
         
         # Get state at checkpoint
-        state_snapshot = graph.get_state(config)
+        state_snapshot = await graph.aget_state(config)
         
         return {
             "success": True,
@@ -209,15 +208,16 @@ async def resume_interrupted(request: ResumeRequest):
         config = {
             "configurable": {
                 "thread_id": request.thread_id,
-                "checkpoint_id": request.checkpoint_id
+                "checkpoint_id": request.checkpoint_id,
+                "deadline": agent.new_deadline()  # Fresh latency budget for the resumed run
             }
         }
         
-        # Build graph
-        graph = agent._build_graph("gemini-2.5-flash-lite")
+        # Get compiled graph
+        graph = agent.get_graph("gemini-2.5-flash-lite")
         
         # Get current state
-        state_snapshot = graph.get_state(config)
+        state_snapshot = await graph.aget_state(config)
         
         # Resume with decision
         # The decision will be passed to the interrupt() call
@@ -241,27 +241,53 @@ async def resume_interrupted(request: ResumeRequest):
 
 
 @router.get("/threads")
-async def list_threads():
+async def list_threads(limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
     """
-    List all active conversation threads
+    List conversation threads, most recently active first
     
     Useful for:
     - Monitoring active conversations
     - Finding threads that need attention
     """
     try:
-        # In a real implementation, this would query the checkpointer
-        # For MemorySaver, we'd need to track threads separately
+        threads = await agent.checkpointer.alist_threads(limit=limit, offset=offset)
         
         return {
             "success": True,
-            "message": "Thread listing requires persistent checkpointer (Postgres/Redis)",
-            "threads": []
+            "threads": [
+                {
+                    "thread_id": thread["thread_id"],
+                    "created_at": str(thread["created_at"]) if thread["created_at"] else None,
+                    "updated_at": str(thread["updated_at"]) if thread["updated_at"] else None
+                }
+                for thread in threads
+            ],
+            "count": len(threads),
+            "limit": limit,
+            "offset": offset
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list threads: {str(e)}")
 
 
+@router.get("/checkpoint-usage")
+async def checkpoint_usage():
+    """
+    Checkpoint storage used by conversation threads, and the retention limits
+    
+    Useful for:
+    - Watching memory/database growth
+    - Tuning CHECKPOINT_KEEP_LAST, CHECKPOINT_THREAD_TTL_SECONDS and CHECKPOINT_MAX_BYTES
+    """
+    try:
+        return {
+            "success": True,
+            "usage": await agent.checkpointer.ausage()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get checkpoint usage: {str(e)}")
+
+
 @router.delete("/thread/{thread_id}")
 async def delete_thread(thread_id: str):
     """
@@ -272,12 +298,12 @@ async def delete_thread(thread_id: str):
     - Privacy/GDPR compliance
     """
     try:
-        # In a real implementation, this would delete from checkpointer
+        await agent.checkpointer.adelete_thread(thread_id)
         
         return {
             "success": True,
             "thread_id": thread_id,
-            "message": "Thread deletion requires persistent checkpointer (Postgres/Redis)"
+            "message": "Thread deleted"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete thread: {str(e)}")
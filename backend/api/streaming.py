@@ -2,15 +2,15 @@
 Phase 4B: Advanced Streaming Features
 Enhanced streaming with multiple modes and custom writers
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Literal
-from ai.agent import LMSAgent
+from ai.agent import lms_agent as agent, CONVERSATION_ID_PATTERN
+from api.sse import cancel_on_disconnect
 import json
 
 router = APIRouter()
-agent = LMSAgent()
 
 
 class StreamRequest(BaseModel):
@@ -18,10 +18,11 @@ class StreamRequest(BaseModel):
     model: str = "gemini-2.5-flash-lite"
     student_id: Optional[int] = None
     stream_mode: Literal["values", "updates", "messages", "debug"] = "updates"
+    conversation_id: Optional[str] = Field(None, pattern=CONVERSATION_ID_PATTERN)  # Omit to start a new conversation
 
 
 @router.post("/stream-advanced")
-async def advanced_stream(request: StreamRequest):
+async def advanced_stream(request: StreamRequest, http_request: Request):
     """
     Phase 4B: Advanced streaming with multiple modes
     
@@ -30,20 +31,27 @@ async def advanced_stream(request: StreamRequest):
     - updates: Stream only state updates (default)
     - messages: Stream only message updates
     - debug: Stream detailed debug information
+    
+    In every mode, response-producing nodes also emit "token" events with
+    LLM output chunks while they generate. The graph run is cancelled if the
+    client disconnects.
     """
     
+    conversation_id = request.conversation_id or agent.new_conversation_id()
+    
     async def generate():
         try:
-            # Initial status
-            yield f"data: {json.dumps({'type': 'start', 'mode': request.stream_mode})}\n\n"
+            # Initial status (with the conversation id to send back next time)
+            yield f"data: {json.dumps({'type': 'start', 'mode': request.stream_mode, 'conversation_id': conversation_id})}\n\n"
             
             # Get message history
             messages = await agent._get_message_history(request.student_id)
             from langchain_core.messages import HumanMessage
             messages.append(HumanMessage(content=request.message))
             
-            # Build graph
-            graph = agent._build_graph(request.model)
+            # Get compiled graph
+            graph = agent.get_graph(request.model)
+            deadline = agent.new_deadline()
             
             # Initial state
             initial_state = {
@@ -54,8 +62,8 @@ async def advanced_stream(request: StreamRequest):
                 "route_reasoning": None,
                 "route_confidence": None,
                 "requires_approval": False,
-                "courses": [],
-                "filtered_courses": [],
+                "catalog_version": 0,
+                "filtered_course_ids": [],
                 "query": None,
                 "enrollment_results": [],
                 "response": "",
@@ -70,50 +78,72 @@ async def advanced_stream(request: StreamRequest):
                 "pending_approval": False,
                 "approval_message": None,
                 "approved": None,
-                "interrupt_data": None
+                "interrupt_data": None,
+                "response_cache_key": None,
+                "response_cache_hit": False,
+                "deadline": deadline,
+                "skipped_stages": []
             }
             
-            # Config
+            # Config (response nodes forward LLM tokens as custom events)
             config = {
                 "configurable": {
-                    "thread_id": f"student_{request.student_id}" if request.student_id else "anonymous"
+                    "thread_id": agent.thread_id(conversation_id, request.student_id),
+                    "stream_tokens": True,
+                    "deadline": deadline
                 }
             }
             
+            # Graph stream mode backing the requested mode ("messages" filters updates)
+            graph_mode = request.stream_mode if request.stream_mode in ("values", "debug") else "updates"
+            
+            # Stream the graph once; "values" tracks the full state for the completion event
+            stream_modes = [graph_mode, "custom"] if graph_mode == "values" else [graph_mode, "values", "custom"]
+            final_state = initial_state
+            
             # Stream based on mode
-            if request.stream_mode == "values":
-                # Stream full state after each node
-                async for state in graph.astream(initial_state, config=config, stream_mode="values"):
-                    yield f"data: {json.dumps({'type': 'state', 'state': self._serialize_state(state)})}\n\n"
-            
-            elif request.stream_mode == "messages":
-                # Stream only message updates
-                async for event in graph.astream(initial_state, config=config, stream_mode="updates"):
+            async for mode, event in graph.astream(initial_state, config=config, stream_mode=stream_modes):
+                if mode == "values":
+                    final_state = event
+                    if request.stream_mode != "values":
+                        continue
+                
+                if mode == "custom":
+                    # Token chunks forwarded while a node is still generating
+                    yield f"data: {json.dumps(event)}\n\n"
+                
+                elif request.stream_mode == "values":
+                    # Stream full state after each node
+                    yield f"data: {json.dumps({'type': 'state', 'state': _serialize_state(event)})}\n\n"
+                
+                elif request.stream_mode == "messages":
+                    # Stream only message updates
                     for node_name, state_update in event.items():
                         if "messages" in state_update or "response" in state_update:
-                            yield f"data: {json.dumps({'type': 'message', 'node': node_name, 'data': state_update})}\n\n"
-            
-            elif request.stream_mode == "debug":
-                # Stream detailed debug info
-                async for event in graph.astream(initial_state, config=config, stream_mode="debug"):
+                            yield f"data: {json.dumps({'type': 'message', 'node': node_name, 'data': _serialize_state(state_update)})}\n\n"
+                
+                elif request.stream_mode == "debug":
+                    # Stream detailed debug info
                     yield f"data: {json.dumps({'type': 'debug', 'event': str(event)})}\n\n"
-            
-            else:  # updates (default)
-                async for event in graph.astream(initial_state, config=config, stream_mode="updates"):
+                
+                else:  # updates (default)
                     for node_name, state_update in event.items():
-                        yield f"data: {json.dumps({'type': 'update', 'node': node_name, 'data': state_update})}\n\n"
-            
-            # Get final state
-            final_state = await graph.ainvoke(initial_state, config=config)
+                        yield f"data: {json.dumps({'type': 'update', 'node': node_name, 'data': _serialize_state(state_update)})}\n\n"
             
             # Send completion
-            yield f"data: {json.dumps({'type': 'complete', 'result': {'response': final_state['response'], 'enrolled': final_state['enrolled']}})}\n\n"
+            result = {
+                'response': final_state['response'],
+                'enrolled': final_state['enrolled'],
+                'skipped_stages': final_state.get('skipped_stages', []),
+                'conversation_id': conversation_id
+            }
+            yield f"data: {json.dumps({'type': 'complete', 'result': result})}\n\n"
             
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
     
     return StreamingResponse(
-        generate(),
+        cancel_on_disconnect(http_request, generate()),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -124,24 +154,27 @@ async def advanced_stream(request: StreamRequest):
 
 
 @router.post("/stream-with-tags")
-async def stream_with_tags(request: StreamRequest):
+async def stream_with_tags(request: StreamRequest, http_request: Request):
     """
     Phase 4B: Stream with tag filtering
     
     Allows filtering stream events by tags for better control
     """
     
+    conversation_id = request.conversation_id or agent.new_conversation_id()
+    
     async def generate():
         try:
-            yield f"data: {json.dumps({'type': 'start', 'message': 'Streaming with tag support'})}\n\n"
+            yield f"data: {json.dumps({'type': 'start', 'message': 'Streaming with tag support', 'conversation_id': conversation_id})}\n\n"
             
             # Get message history
             messages = await agent._get_message_history(request.student_id)
             from langchain_core.messages import HumanMessage
             messages.append(HumanMessage(content=request.message))
             
-            # Build graph
-            graph = agent._build_graph(request.model)
+            # Get compiled graph
+            graph = agent.get_graph(request.model)
+            deadline = agent.new_deadline()
             
             # Initial state
             initial_state = {
@@ -149,42 +182,51 @@ async def stream_with_tags(request: StreamRequest):
                 "student_id": request.student_id,
                 "messages": messages,
                 "route": None,
-                "courses": [],
+                "catalog_version": 0,
                 "response": "",
                 "model_used": request.model,
                 "enrolled": False,
-                "suggestions": []
+                "suggestions": [],
+                "response_cache_key": None,
+                "response_cache_hit": False,
+                "deadline": deadline,
+                "skipped_stages": []
             }
             
             # Config with tags
             config = {
                 "configurable": {
-                    "thread_id": f"student_{request.student_id}" if request.student_id else "anonymous"
+                    "thread_id": agent.thread_id(conversation_id, request.student_id),
+                    "deadline": deadline
                 },
                 "tags": ["chat", "lms", f"model:{request.model}"]
             }
             
-            # Stream with tags
-            async for event in graph.astream(initial_state, config=config, stream_mode="updates"):
+            # Stream with tags in a single pass; "values" tracks the final state
+            final_state = initial_state
+            async for mode, event in graph.astream(initial_state, config=config, stream_mode=["updates", "values"]):
+                if mode == "values":
+                    final_state = event
+                    continue
+                
                 for node_name, state_update in event.items():
                     # Add node-specific tags
                     event_data = {
                         "type": "update",
                         "node": node_name,
                         "tags": [node_name, "update"],
-                        "data": state_update
+                        "data": _serialize_state(state_update)
                     }
                     yield f"data: {json.dumps(event_data)}\n\n"
             
             # Final result
-            final_state = await graph.ainvoke(initial_state, config=config)
-            yield f"data: {json.dumps({'type': 'complete', 'tags': ['complete'], 'result': {'response': final_state['response']}})}\n\n"
+            yield f"data: {json.dumps({'type': 'complete', 'tags': ['complete'], 'result': {'response': final_state['response'], 'conversation_id': conversation_id}})}\n\n"
             
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'tags': ['error'], 'message': str(e)})}\n\n"
     
     return StreamingResponse(
-        generate(),
+        cancel_on_disconnect(http_request, generate()),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -195,6 +237,9 @@ async def stream_with_tags(request: StreamRequest):
 
 def _serialize_state(state):
     """Helper to serialize state for JSON"""
+    if not isinstance(state, dict):
+        # e.g. the "__interrupt__" update carries Interrupt objects
+        return str(state)
     serialized = {}
     for key, value in state.items():
         if key == "messages":
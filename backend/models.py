@@ -56,6 +56,81 @@ class ChatHistory(models.Model):
         table = "chat_history"
 
 
+# Routing decisions, used as training labels for the local intent classifier
+class RouteDecisionLog(models.Model):
+    id = fields.IntField(pk=True)
+    message = fields.TextField()
+    intent = fields.CharField(max_length=50)
+    confidence = fields.FloatField()
+    source = fields.CharField(max_length=20)  # llm, classifier or keywords
+    model_used = fields.CharField(max_length=100)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "route_decisions"
+
+
+# LangGraph checkpoints (ai/checkpointer.py); one row per thread for fast listing
+class CheckpointThread(models.Model):
+    id = fields.BigIntField(pk=True)
+    thread_id = fields.CharField(max_length=255, unique=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(index=True)
+    size_bytes = fields.BigIntField(default=0)  # Measured when the thread is pruned, used for the byte budget
+
+    class Meta:
+        table = "checkpoint_threads"
+
+
+class CheckpointRecord(models.Model):
+    id = fields.BigIntField(pk=True)
+    thread_id = fields.CharField(max_length=255)
+    checkpoint_ns = fields.CharField(max_length=255, default="")
+    checkpoint_id = fields.CharField(max_length=64)
+    parent_checkpoint_id = fields.CharField(max_length=64, null=True)
+    type = fields.CharField(max_length=32)
+    checkpoint = fields.BinaryField()  # Serialized checkpoint without channel values
+    metadata_type = fields.CharField(max_length=32)
+    metadata = fields.BinaryField()
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "checkpoints"
+        unique_together = (("thread_id", "checkpoint_ns", "checkpoint_id"),)
+
+
+# Channel values are stored once per version, so unchanged channels aren't rewritten on every step
+class CheckpointBlob(models.Model):
+    id = fields.BigIntField(pk=True)
+    thread_id = fields.CharField(max_length=255)
+    checkpoint_ns = fields.CharField(max_length=255, default="")
+    channel = fields.CharField(max_length=255)
+    version = fields.CharField(max_length=64)
+    type = fields.CharField(max_length=32)
+    blob = fields.BinaryField(null=True)
+
+    class Meta:
+        table = "checkpoint_blobs"
+        unique_together = (("thread_id", "checkpoint_ns", "channel", "version"),)
+
+
+class CheckpointWrite(models.Model):
+    id = fields.BigIntField(pk=True)
+    thread_id = fields.CharField(max_length=255)
+    checkpoint_ns = fields.CharField(max_length=255, default="")
+    checkpoint_id = fields.CharField(max_length=64)
+    task_id = fields.CharField(max_length=255)
+    task_path = fields.CharField(max_length=255, default="")
+    idx = fields.IntField()
+    channel = fields.CharField(max_length=255)
+    type = fields.CharField(max_length=32)
+    blob = fields.BinaryField()
+
+    class Meta:
+        table = "checkpoint_writes"
+        unique_together = (("thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx"),)
+
+
 # Pydantic models for API
 class Student_Pydantic(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,177 @@
+"""
+Test the Postgres checkpointer round-trip, pending writes, pruning and the byte budget
+Runs against an in-memory SQLite database through the same Tortoise models.
+"""
+import asyncio
+
+from langgraph.checkpoint.base import empty_checkpoint
+from tortoise import Tortoise
+
+from ai.checkpointer import CheckpointRetention, PostgresCheckpointer, next_version
+from models import CheckpointBlob, CheckpointRecord, CheckpointThread
+
+
+THREAD = {"configurable": {"thread_id": "student_1:test", "checkpoint_ns": ""}}
+
+
+def run(test, **checkpointer_options):
+    """Run an async test body with a fresh database and checkpointer"""
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["models"]})
+        await Tortoise.generate_schemas()
+        try:
+            saver = PostgresCheckpointer(**checkpointer_options)
+            await test(saver)
+            await saver.aflush()
+        finally:
+            await Tortoise.close_connections()
+
+    asyncio.run(main())
+
+
+def thread(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+async def put_steps(saver, updates, config=THREAD):
+    """Store one checkpoint per dict of channel updates, like a graph run; returns their configs"""
+    values, versions, configs = {}, {}, []
+    for step, update in enumerate(updates):
+        new_versions = {}
+        for channel, value in update.items():
+            values[channel] = value
+            versions[channel] = new_versions[channel] = next_version(versions.get(channel))
+
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = dict(values)
+        checkpoint["channel_versions"] = dict(versions)
+        config = await saver.aput(config, checkpoint, {"source": "loop", "step": step}, new_versions)
+        configs.append(config)
+    return configs
+
+
+def test_put_get_list_round_trip():
+    """Latest and historical checkpoints load with every channel value, newest first"""
+    async def body(saver):
+        configs = await put_steps(saver, [
+            {"message": "hi", "route": "general_qa"},
+            {"response": "hello"},
+            {"response": "hello again"},
+        ])
+
+        latest = await saver.aget_tuple(THREAD)
+        assert latest.config == configs[-1]
+        assert latest.parent_config == configs[-2]
+        assert latest.checkpoint["channel_values"] == {
+            "message": "hi", "route": "general_qa", "response": "hello again"
+        }
+        assert latest.metadata["step"] == 2
+
+        first = await saver.aget_tuple(configs[0])
+        assert first.checkpoint["channel_values"] == {"message": "hi", "route": "general_qa"}
+        assert first.parent_config is None
+
+        history = [t async for t in saver.alist(THREAD)]
+        assert [t.config for t in history] == configs[::-1]
+        assert [t.config async for t in saver.alist(THREAD, before=configs[-1])] == configs[-2::-1]
+        assert [t.config async for t in saver.alist(THREAD, filter={"step": 1})] == [configs[1]]
+        assert len([t async for t in saver.alist(THREAD, limit=2)]) == 2
+
+        threads = await saver.alist_threads()
+        assert [t["thread_id"] for t in threads] == ["student_1:test"]
+
+    run(body, retention=CheckpointRetention(keep_last=0, thread_ttl_seconds=0, max_bytes=0))
+
+
+def test_pending_writes():
+    """Writes load with their checkpoint; regular writes keep the first value, error writes the last"""
+    async def body(saver):
+        configs = await put_steps(saver, [{"message": "hi"}])
+
+        await saver.aput_writes(configs[0], [("response", "draft"), ("route", "general_qa")], task_id="task-a")
+        await saver.aput_writes(configs[0], [("response", "retried")], task_id="task-a")
+        await saver.aput_writes(configs[0], [("__error__", "first failure")], task_id="task-b")
+        await saver.aput_writes(configs[0], [("__error__", "second failure")], task_id="task-b")
+
+        loaded = await saver.aget_tuple(THREAD)
+        assert loaded.pending_writes == [
+            ("task-a", "response", "draft"),
+            ("task-a", "route", "general_qa"),
+            ("task-b", "__error__", "second failure"),
+        ]
+
+        # A new checkpoint starts without pending writes
+        next_config = await saver.aput(configs[0], empty_checkpoint(), {"step": 1}, {})
+        assert (await saver.aget_tuple(next_config)).pending_writes == []
+
+    run(body, retention=CheckpointRetention(keep_last=0, thread_ttl_seconds=0, max_bytes=0))
+
+
+def test_async_durability_reads_own_writes():
+    """Background commits are awaited before a thread is read"""
+    async def body(saver):
+        configs = await put_steps(saver, [{"message": "hi"}, {"response": "hello"}])
+        assert (await saver.aget_tuple(THREAD)).config == configs[-1]
+        assert len([t async for t in saver.alist(THREAD)]) == 2
+
+    run(body, durability="async", retention=CheckpointRetention(keep_last=0, thread_ttl_seconds=0, max_bytes=0))
+
+
+def test_prune_keeps_referenced_blobs():
+    """Pruning drops old checkpoints and blobs but keeps every version a kept checkpoint uses"""
+    async def body(saver):
+        # "message" is written once and never changes, so every checkpoint references its first version
+        updates = [{"message": "hi", "response": "r0"}] + [{"response": f"r{step}"} for step in range(1, 6)]
+        configs = await put_steps(saver, updates)
+        await saver.aflush()  # Let any background prune finish first
+
+        await saver._prune_thread("student_1:test", "")
+
+        history = [t async for t in saver.alist(THREAD)]
+        assert [t.config for t in history] == configs[:-3:-1]
+        for step, checkpoint in zip((5, 4), history):
+            assert checkpoint.checkpoint["channel_values"] == {"message": "hi", "response": f"r{step}"}
+
+        assert await CheckpointRecord.filter(thread_id="student_1:test").count() == 2
+        assert await CheckpointBlob.filter(thread_id="student_1:test", channel="message").count() == 1
+        assert await CheckpointBlob.filter(thread_id="student_1:test", channel="response").count() == 2
+
+        usage = await saver.ausage()
+        assert usage["threads"] == 1 and usage["bytes"] > 0
+
+    run(body, retention=CheckpointRetention(keep_last=2, thread_ttl_seconds=0, max_bytes=0))
+
+
+def test_size_tracked_and_budget_eviction():
+    """Every write adds to its thread's size, and eviction stops once the total fits the budget"""
+    async def body(saver):
+        for n in range(5):
+            configs = await put_steps(saver, [{"message": f"hi {n}"}, {"response": "x" * 200}], thread(f"t{n}"))
+            await saver.aput_writes(configs[-1], [("response", "draft")], task_id="task-a")
+
+        # Never pruned, yet each thread's size matches what is stored
+        sizes = dict(await CheckpointThread.all().values_list("thread_id", "size_bytes"))
+        for thread_id, size in sizes.items():
+            await saver._measure_thread(thread_id)
+            assert size > 0
+            assert await CheckpointThread.get(thread_id=thread_id).values_list("size_bytes", flat=True) == size
+        usage = await saver.ausage()
+        assert usage["bytes"] == sum(sizes.values())
+
+        # Over budget by exactly the oldest thread: only that one goes
+        saver.retention.max_bytes = usage["bytes"] - sizes["t0"]
+        await saver.aenforce_retention()
+        assert sorted(await CheckpointThread.all().values_list("thread_id", flat=True)) == ["t1", "t2", "t3", "t4"]
+        assert await CheckpointRecord.filter(thread_id="t0").count() == 0
+        assert (await saver.ausage())["bytes"] <= saver.retention.max_bytes
+
+    run(body, retention=CheckpointRetention(keep_last=0, thread_ttl_seconds=0, max_bytes=0))
+
+
+if __name__ == "__main__":
+    test_put_get_list_round_trip()
+    test_pending_writes()
+    test_async_durability_reads_own_writes()
+    test_prune_keeps_referenced_blobs()
+    test_size_tracked_and_budget_eviction()
+    print("✅ Checkpointer tests passed")
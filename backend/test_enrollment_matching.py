@@ -1,7 +1,7 @@
 """
 Test enrollment matching to ensure correct courses are matched
 """
-import asyncio
+from ai.enrollment_matcher import EnrollmentMatcher
 
 
 # Mock courses
@@ -45,6 +45,8 @@ def test_enrollment_matching():
         },
     ]
     
+    matcher = EnrollmentMatcher(MOCK_COURSES)
+    
     print("="*60)
     print("ENROLLMENT MATCHING TESTS")
     print("="*60)
@@ -53,77 +55,18 @@ def test_enrollment_matching():
         print(f"\nTest {i}: {test['message']}")
         print(f"Expected: {test['expected']}")
         
-        # Simulate matching logic
-        message_lower = test['message'].lower()
-        matched_courses = []
-        
-        for course in MOCK_COURSES:
-            course_title_lower = course["title"].lower()
-            
-            # Check if full course title is mentioned
-            if course_title_lower in message_lower:
-                matched_courses.append(course["title"])
-                continue
-            
-            # Extract meaningful words
-            title_words = [w for w in course_title_lower.split() if w not in ['to', 'the', 'and', 'with', 'for', 'from', 'a', 'an', 'in', 'of', 'on']]
-            
-            # Check for abbreviation matches (standalone words only)
-            message_words = message_lower.split()
-            abbreviations = {
-                "ai": ["artificial", "intelligence"],
-                "ml": ["machine", "learning"],
-            }
-            
-            matched_via_abbr = False
-            for abbr, full_words in abbreviations.items():
-                if abbr in message_words:
-                    if all(word in course_title_lower for word in full_words):
-                        # Check for specific words
-                        specific_words = ["ethics", "basics", "introduction", "advanced", "deep", "neural"]
-                        has_specific = any(word in message_lower for word in specific_words)
-                        
-                        if not has_specific or any(word in course_title_lower for word in specific_words if word in message_lower):
-                            matched_courses.append(course["title"])
-                            matched_via_abbr = True
-                            break
-            
-            if matched_via_abbr:
-                continue
-            
-            # Check for keyword matches (need 2-3 words)
-            if len(title_words) >= 2:
-                matched_words = [word for word in title_words if word in message_lower]
-                min_matches = 3 if len(title_words) >= 4 else 2
-                
-                if len(matched_words) >= min_matches:
-                    positions = []
-                    for word in matched_words[:min_matches]:
-                        if word in message_words:
-                            positions.append(message_words.index(word))
-                    
-                    if len(positions) >= min_matches:
-                        max_distance = max(positions) - min(positions)
-                        if max_distance <= 5:
-                            matched_courses.append(course["title"])
+        # Same matcher the enrollment node uses
+        matched_courses = [course["title"] for course in matcher.match(test['message'].lower())]
         
         # Check results
         print(f"Matched: {matched_courses}")
         
         # Verify expected matches
-        all_expected_found = all(exp in matched_courses for exp in test['expected'])
-        no_wrong_matches = all(wrong not in matched_courses for wrong in test['should_not_match'])
-        
-        if all_expected_found and no_wrong_matches:
-            print("✅ PASS")
-        else:
-            print("❌ FAIL")
-            if not all_expected_found:
-                missing = [exp for exp in test['expected'] if exp not in matched_courses]
-                print(f"   Missing: {missing}")
-            if not no_wrong_matches:
-                wrong = [wrong for wrong in test['should_not_match'] if wrong in matched_courses]
-                print(f"   Wrong matches: {wrong}")
+        missing = [exp for exp in test['expected'] if exp not in matched_courses]
+        wrong = [course for course in test['should_not_match'] if course in matched_courses]
+        assert not missing, f"Test {i}: missing {missing}"
+        assert not wrong, f"Test {i}: wrong matches {wrong}"
+        print("✅ PASS")
     
     print("\n" + "="*60)
 
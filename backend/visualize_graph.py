@@ -10,7 +10,7 @@ async def visualize():
     agent = LMSAgent()
     
     # Build the graph
-    graph = agent._build_graph("gemini-2.5-flash-lite")
+    graph = agent.get_graph("gemini-2.5-flash-lite")
     
     # Get the graph visualization
     try:
@@ -23,6 +23,8 @@ export default function ChatInterface({ studentId, onEnrollmentChange, messages,
   const [model, setModel] = useState('gemini-2.5-flash-lite')
   const [models, setModels] = useState<any[]>([])
   const [suggestions, setSuggestions] = useState<string[]>([])
+  // Issued by the backend on the first reply; keeps this chat on its own conversation thread
+  const [conversationId, setConversationId] = useState<string | undefined>(undefined)
   const [isListening, setIsListening] = useState(false)
   const [speakingIndex, setSpeakingIndex] = useState<number | null>(null)
   const messagesEndRef = useRef<HTMLDivElement>(null)
@@ -134,8 +136,10 @@ export default function ChatInterface({ studentId, onEnrollmentChange, messages,
       const response = await chatApi.sendMessage({
         message: text,
         student_id: studentId,
-        model: model
+        model: model,
+        conversation_id: conversationId
       })
+      setConversationId(response.data.conversation_id)
 
       const assistantMessage: Message = {
         role: 'assistant',
@@ -3,15 +3,18 @@
 import { useState } from "react";
 
 interface StreamUpdate {
-  type: "status" | "node_update" | "complete" | "error";
+  type: "status" | "node_update" | "token" | "token_reset" | "complete" | "error";
   status: string;
   message?: string;
+  conversation_id?: string;
   node?: string;
+  content?: string;
   data?: any;
   result?: {
     response: string;
     suggestions: string[];
     enrolled: boolean;
+    conversation_id?: string;
   };
 }
 
@@ -28,7 +31,10 @@ export default function StreamingChat({
   const [streaming, setStreaming] = useState(false);
   const [updates, setUpdates] = useState<StreamUpdate[]>([]);
   const [finalResponse, setFinalResponse] = useState<string | null>(null);
+  const [draft, setDraft] = useState<{ node?: string; text: string } | null>(null);
   const [suggestions, setSuggestions] = useState<string[]>([]);
+  // Issued by the backend on the first stream; keeps this chat on its own conversation thread
+  const [conversationId, setConversationId] = useState<string | undefined>(undefined);
 
   const handleStreamChat = async () => {
     if (!message.trim()) return;
@@ -36,6 +42,7 @@ export default function StreamingChat({
     setStreaming(true);
     setUpdates([]);
     setFinalResponse(null);
+    setDraft(null);
     setSuggestions([]);
 
     try {
@@ -49,6 +56,7 @@ export default function StreamingChat({
           message,
           model,
           student_id: studentId,
+          conversation_id: conversationId,
         }),
       });
 
@@ -69,6 +77,26 @@ export default function StreamingChat({
         for (const line of lines) {
           if (line.startsWith("data: ")) {
             const data = JSON.parse(line.slice(6));
+
+            // Token events build the live draft instead of the update log;
+            // a new node (e.g. the optimizer) starts a fresh draft
+            if (data.type === "token") {
+              setDraft((prev) =>
+                prev && prev.node === data.node
+                  ? { node: data.node, text: prev.text + data.content }
+                  : { node: data.node, text: data.content }
+              );
+              continue;
+            }
+            if (data.type === "token_reset") {
+              setDraft({ node: data.node, text: data.content });
+              continue;
+            }
+
+            if (data.conversation_id) {
+              setConversationId(data.conversation_id);
+            }
+
             setUpdates((prev) => [...prev, data]);
 
             if (data.type === "complete" && data.result) {
@@ -184,6 +212,17 @@ export default function StreamingChat({
         </div>
       )}
 
+      {/* Live Draft */}
+      {!finalResponse && draft && (
+        <div className="bg-white border border-gray-200 rounded-lg shadow-md p-6">
+          <h3 className="text-lg font-semibold mb-3 flex items-center text-gray-800">
+            <span className="mr-2">✍️</span>
+            Generating...
+          </h3>
+          <div className="text-gray-700 whitespace-pre-wrap">{draft.text}</div>
+        </div>
+      )}
+
       {/* Final Response */}
       {finalResponse && (
         <div className="bg-gradient-to-r from-green-50 to-blue-50 border border-green-200 rounded-lg shadow-md p-6">
@@ -30,7 +30,7 @@ export const enrollmentsApi = {
 }
 
 export const chatApi = {
-  sendMessage: (data: { message: string; student_id?: number; model?: string }) =>
+  sendMessage: (data: { message: string; student_id?: number; model?: string; conversation_id?: string }) =>
     api.post('/api/chat', data),
   getModels: () => api.get('/api/chat/models'),
   getHistory: (studentId: number) => api.get(`/api/chat/history/${studentId}`),